@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+
+    Each worker process keeps its own copy, so keep TTLs short for data that
+    another worker may change.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate) -> None:
+        # Drops every entry whose key matches; for invalidating a key family.
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Latest profiles row per user_id. Read through by the profile GET endpoints and
+# dropped by every endpoint that writes to profiles. Kept short because profile
+# writes from outside this process (edge function, dashboard) are not seen.
+profile_cache = TTLCache(maxsize=4096, ttl=15)
+
+# progress_photos rows tagged category:starting per user_id. These rarely change
+# after onboarding; dropped on photo uploads/deletes and profile updates.
+starting_photo_cache = TTLCache(maxsize=10_000, ttl=300)
+
+# Saved workout templates list per user_id. Dropped when a template owned by
+# the user is created, duplicated, updated or deleted.
+template_list_cache = TTLCache(maxsize=4096, ttl=60)
+
+# get_template_detail responses per template_id. Dropped on update/delete.
+template_detail_cache = TTLCache(maxsize=4096, ttl=60)
+
+# exercise_history responses keyed by (user_id, exercise_name, limit). Dropped
+# for an exercise name whenever a set of it is logged, and for a user when one
+# of their sessions is completed.
+exercise_history_cache = TTLCache(maxsize=4096, ttl=60)
@@ -1,13 +1,15 @@
+import asyncio
 import base64
-import json
 import os
 import time
-from urllib.error import HTTPError
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+from functools import lru_cache
 
+import httpx
+import orjson
 from fastapi import HTTPException
 
+from .cache import TTLCache
+
 FATSECRET_OAUTH_URL = "https://oauth.fatsecret.com/connect/token"
 FATSECRET_API_URL = "https://platform.fatsecret.com/rest"
 FATSECRET_METHOD_API_URL = "https://platform.fatsecret.com/rest/server.api"
@@ -18,6 +20,11 @@ FATSECRET_URL_ENDPOINTS = {
     "food.find_id_for_barcode": "/food/barcode/v3",
 }
 _TOKEN_CACHE = {"access_token": None, "expires_at": 0}
+_TOKEN_LOCK = asyncio.Lock()
+_RATE_LIMIT_RETRIES = 3
+# Food search/detail payloads are the same for every user; error payloads are not cached.
+_response_cache = TTLCache(maxsize=10_000, ttl=600)
+_inflight: dict[tuple, asyncio.Task] = {}
 
 
 def _get_credentials() -> tuple[str, str]:
@@ -31,30 +38,39 @@ def _get_credentials() -> tuple[str, str]:
     return client_id, client_secret
 
 
-def _fetch_token() -> str:
+@lru_cache(maxsize=1)
+def _get_http_client() -> httpx.AsyncClient:
+    # One pooled client per process so parallel detail lookups reuse connections.
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
+
+
+async def close_http_client() -> None:
+    if _get_http_client.cache_info().currsize:
+        await _get_http_client().aclose()
+        _get_http_client.cache_clear()
+
+
+async def _fetch_token() -> str:
     client_id, client_secret = _get_credentials()
     auth = base64.b64encode(f"{client_id}:{client_secret}".encode("utf-8")).decode(
         "utf-8"
     )
-    data = urlencode({"grant_type": "client_credentials", "scope": "basic"}).encode(
-        "utf-8"
-    )
-    request = Request(
-        FATSECRET_OAUTH_URL,
-        data=data,
-        headers={
-            "Authorization": f"Basic {auth}",
-            "Content-Type": "application/x-www-form-urlencoded",
-        },
-        method="POST",
-    )
     try:
-        with urlopen(request) as response:
-            payload = json.loads(response.read().decode("utf-8"))
-    except HTTPError as exc:
-        detail = exc.read().decode("utf-8") if exc.fp else str(exc)
+        response = await _get_http_client().post(
+            FATSECRET_OAUTH_URL,
+            data={"grant_type": "client_credentials", "scope": "basic"},
+            headers={"Authorization": f"Basic {auth}"},
+        )
+        response.raise_for_status()
+        payload = response.json()
+    except httpx.HTTPStatusError as exc:
         raise HTTPException(
-            status_code=500, detail=f"FatSecret token request failed: {detail}"
+            status_code=500,
+            detail=f"FatSecret token request failed: {exc.response.text or exc}",
         )
     except Exception as exc:
         raise HTTPException(
@@ -72,42 +88,69 @@ def _fetch_token() -> str:
     return access_token
 
 
-def _get_token() -> str:
-    now = int(time.time())
+def _cached_token() -> str | None:
     access_token = _TOKEN_CACHE.get("access_token")
-    if access_token and now < int(_TOKEN_CACHE.get("expires_at") or 0):
+    if access_token and int(time.time()) < int(_TOKEN_CACHE.get("expires_at") or 0):
         return access_token
-    return _fetch_token()
+    return None
 
 
-def _fatsecret_url_request(path: str, params: dict) -> dict:
-    token = _get_token()
-    query = {"format": "json", **params}
-    url = f"{FATSECRET_API_URL}{path}?{urlencode(query)}"
-    request = Request(url, headers={"Authorization": f"Bearer {token}"})
-    try:
-        with urlopen(request) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body)
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"FatSecret request failed: {exc}")
+async def _get_token() -> str:
+    access_token = _cached_token()
+    if access_token:
+        return access_token
+    # Parallel requests that find the token expired share a single refresh.
+    async with _TOKEN_LOCK:
+        return _cached_token() or await _fetch_token()
 
 
-def _fatsecret_method_request(method: str, params: dict) -> dict:
-    token = _get_token()
-    query = {"method": method, "format": "json", **params}
-    url = f"{FATSECRET_METHOD_API_URL}?{urlencode(query)}"
-    request = Request(url, headers={"Authorization": f"Bearer {token}"})
+@lru_cache(maxsize=1)
+def _get_request_semaphore() -> asyncio.Semaphore:
+    # Caps in-flight FatSecret calls so search fan-out stays under their rate limit.
+    return asyncio.Semaphore(int(os.environ.get("FATSECRET_CONCURRENCY", "5")))
+
+
+async def _fatsecret_get(url: str, query: dict) -> dict:
+    token = await _get_token()
     try:
-        with urlopen(request) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body)
+        async with _get_request_semaphore():
+            for attempt in range(_RATE_LIMIT_RETRIES + 1):
+                response = await _get_http_client().get(
+                    url, params=query, headers={"Authorization": f"Bearer {token}"}
+                )
+                if response.status_code != 429 or attempt == _RATE_LIMIT_RETRIES:
+                    break
+                await asyncio.sleep(0.5 * 2**attempt)
+        response.raise_for_status()
+        return orjson.loads(response.content)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"FatSecret request failed: {exc}")
 
 
-def fatsecret_request(method: str, params: dict) -> dict:
+async def _fetch_and_cache(method: str, params: dict, cache_key: tuple) -> dict:
     path = FATSECRET_URL_ENDPOINTS.get(method)
     if path:
-        return _fatsecret_url_request(path, params)
-    return _fatsecret_method_request(method, params)
+        payload = await _fatsecret_get(f"{FATSECRET_API_URL}{path}", {"format": "json", **params})
+    else:
+        payload = await _fatsecret_get(
+            FATSECRET_METHOD_API_URL, {"method": method, "format": "json", **params}
+        )
+    if not payload.get("error"):
+        _response_cache.set(cache_key, payload)
+    return payload
+
+
+async def fatsecret_request(method: str, params: dict) -> dict:
+    cache_key = (method, tuple(sorted(params.items())))
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # Identical calls already in flight (e.g. autocomplete while typing) share
+    # one upstream request instead of each firing their own.
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_cache(method, params, cache_key))
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+    # Shielded so one caller disconnecting does not cancel the shared fetch.
+    return await asyncio.shield(task)
@@ -1,8 +1,15 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from dotenv import load_dotenv
 
+from .fatsecret_client import close_http_client as close_fatsecret_client
+from .responses import ORJSONResponse
+from .supabase_client import get_supabase
 from .routers import (
     auth,
     workouts,
@@ -22,7 +29,27 @@ from .routers import (
 )
 
 load_dotenv(dotenv_path=Path(__file__).resolve().parents[1] / ".env")
-app = FastAPI(title="FitAI Backend")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # supabase-py and run_prompt are blocking and run via asyncio.to_thread; the
+    # default pool (cpu_count + 4 threads) would cap concurrent DB calls.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=64, thread_name_prefix="blocking-io")
+    )
+    # Builds the shared client now so missing Supabase settings stop startup
+    # instead of failing the first request.
+    get_supabase()
+    yield
+    await close_fatsecret_client()
+    await nutrition.close_usda_client()
+
+
+app = FastAPI(title="FitAI Backend", lifespan=lifespan, default_response_class=ORJSONResponse)
+# List endpoints (check-ins, coach discovery, food/exercise search, favorites)
+# return sizable JSON; small bodies and SSE streams are left uncompressed.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(workouts.router, prefix="/workouts", tags=["workouts"])
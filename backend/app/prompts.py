@@ -1,6 +1,7 @@
 import json
 import os
 import re
+from collections.abc import Iterator
 from datetime import datetime
 
 from openai import OpenAI
@@ -23,36 +24,32 @@ def _get_client() -> OpenAI:
         raise ValueError("OPENAI_API_KEY is not set")
     return OpenAI(api_key=api_key)
 
-def _clean_photo_url(value) -> str | None:
+def clean_photo_url(value) -> str | None:
     if not isinstance(value, str):
         return None
     trimmed = value.strip()
     return trimmed or None
 
-def _extract_photo_urls(value) -> list[str]:
+def extract_photo_urls(value, seen: set[str] | None = None) -> list[str]:
+    # When a shared `seen` set is passed, URLs already in it are skipped and new ones recorded.
     if not isinstance(value, list):
         return []
     urls: list[str] = []
     for item in value:
         if isinstance(item, str):
-            cleaned = _clean_photo_url(item)
+            cleaned = clean_photo_url(item)
         elif isinstance(item, dict):
-            cleaned = _clean_photo_url(item.get("url"))
+            cleaned = clean_photo_url(item.get("url"))
         else:
             cleaned = None
-        if cleaned:
-            urls.append(cleaned)
-    return urls
-
-def _dedupe_photo_urls(urls: list[str]) -> list[str]:
-    seen: set[str] = set()
-    result: list[str] = []
-    for url in urls:
-        if url in seen:
+        if not cleaned:
             continue
-        seen.add(url)
-        result.append(url)
-    return result
+        if seen is not None:
+            if cleaned in seen:
+                continue
+            seen.add(cleaned)
+        urls.append(cleaned)
+    return urls
 
 
 def parse_json_output(raw_output: str) -> dict:
@@ -95,7 +92,7 @@ def update_job(job_id, payload: dict):
     supabase = get_supabase()
     supabase.table("ai_jobs").update(payload).eq("id", job_id).execute()
 
-def run_prompt(name: str, user_id=None, inputs=None):
+def _start_job(name: str, user_id=None, inputs=None) -> tuple[dict, str | None]:
     supabase = get_supabase()
     prompt = (
         supabase.table("ai_prompts")
@@ -117,45 +114,55 @@ def run_prompt(name: str, user_id=None, inputs=None):
         "metadata": {"version": prompt.get("version")},
         "created_at": datetime.utcnow().isoformat(),
     }
-    job_id = log_job(job_payload)
+    return prompt, log_job(job_payload)
+
+def _completion_request(name: str, prompt: dict, inputs=None) -> dict:
+    input_payload = inputs or {}
+    user_content: list[dict] | str
+    seen_urls: set[str] = set()
+    single_photo_url = (
+        clean_photo_url(input_payload.get("photo_url")) if isinstance(input_payload, dict) else None
+    )
+    all_urls = [single_photo_url] if single_photo_url else []
+    seen_urls.update(all_urls)
+    if isinstance(input_payload, dict):
+        all_urls.extend(extract_photo_urls(input_payload.get("photo_urls"), seen_urls))
+        all_urls.extend(extract_photo_urls(input_payload.get("comparison_photo_urls"), seen_urls))
+    if all_urls:
+        user_content = [{"type": "text", "text": json.dumps(input_payload)}]
+        user_content.extend({"type": "image_url", "image_url": {"url": url}} for url in all_urls)
+    else:
+        user_content = json.dumps(input_payload)
+    # Use gpt-4o for check-in analysis (better image analysis for progress photos)
+    # Use gpt-4.1-mini for meal photo parsing (better food identification + portions)
+    # Use gpt-4o-mini for other prompts (faster and cheaper)
+    if name == "weekly_checkin_analysis":
+        model = "gpt-4o"
+    elif name == "meal_photo_parse":
+        model = "gpt-4.1-mini"
+    else:
+        model = "gpt-4o-mini"
+    template = prompt["template"]
+    if name == "weekly_checkin_analysis":
+        template = f"{template}\n\n{WEEKLY_CHECKIN_FOCUS_APPENDIX}"
+    # The stored template is the static system message and the inputs follow
+    # as the user message, so requests for the same prompt share a cacheable
+    # prefix. Keying the cache on the prompt name keeps them routed together;
+    # it is sent via extra_body because older SDKs lack the argument.
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": template},
+            {"role": "user", "content": user_content},
+        ],
+        "extra_body": {"prompt_cache_key": name},
+    }
+
+def run_prompt(name: str, user_id=None, inputs=None):
+    prompt, job_id = _start_job(name, user_id=user_id, inputs=inputs)
     try:
-        input_payload = inputs or {}
-        user_content: list[dict] | str
-        photo_urls = _extract_photo_urls(input_payload.get("photo_urls")) if isinstance(input_payload, dict) else []
-        single_photo_url = (
-            _clean_photo_url(input_payload.get("photo_url")) if isinstance(input_payload, dict) else None
-        )
-        if single_photo_url:
-            photo_urls = [single_photo_url, *photo_urls]
-        comparison_urls = (
-            _extract_photo_urls(input_payload.get("comparison_photo_urls")) if isinstance(input_payload, dict) else []
-        )
-        all_urls = _dedupe_photo_urls(photo_urls + comparison_urls)
-        if all_urls:
-            user_content = [{"type": "text", "text": json.dumps(input_payload)}]
-            user_content.extend({"type": "image_url", "image_url": {"url": url}} for url in all_urls)
-        else:
-            user_content = json.dumps(input_payload)
         client = _get_client()
-        # Use gpt-4o for check-in analysis (better image analysis for progress photos)
-        # Use gpt-4.1-mini for meal photo parsing (better food identification + portions)
-        # Use gpt-4o-mini for other prompts (faster and cheaper)
-        if name == "weekly_checkin_analysis":
-            model = "gpt-4o"
-        elif name == "meal_photo_parse":
-            model = "gpt-4.1-mini"
-        else:
-            model = "gpt-4o-mini"
-        template = prompt["template"]
-        if name == "weekly_checkin_analysis":
-            template = f"{template}\n\n{WEEKLY_CHECKIN_FOCUS_APPENDIX}"
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": template},
-                {"role": "user", "content": user_content},
-            ],
-        )
+        response = client.chat.completions.create(**_completion_request(name, prompt, inputs))
         output = response.choices[0].message.content
         if job_id:
             update_job(job_id, {"output": output, "status": "completed"})
@@ -164,3 +171,27 @@ def run_prompt(name: str, user_id=None, inputs=None):
         if job_id:
             update_job(job_id, {"status": "failed", "metadata": {"error": str(exc)}})
         raise
+
+def stream_prompt(name: str, user_id=None, inputs=None) -> Iterator[str]:
+    # Same as run_prompt, but yields the output text as the model produces it.
+    # The job row is completed with the joined output once the stream ends.
+    prompt, job_id = _start_job(name, user_id=user_id, inputs=inputs)
+    chunks: list[str] = []
+    try:
+        client = _get_client()
+        response = client.chat.completions.create(
+            **_completion_request(name, prompt, inputs), stream=True
+        )
+        for event in response:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield delta
+        if job_id:
+            update_job(job_id, {"output": "".join(chunks), "status": "completed"})
+    except Exception as exc:
+        if job_id:
+            update_job(job_id, {"status": "failed", "metadata": {"error": str(exc)}})
+        raise
@@ -0,0 +1,15 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Kept local rather than importing fastapi.responses.ORJSONResponse, which
+    newer FastAPI releases deprecate.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from uuid import uuid4
-import hashlib
+import asyncio
 
-from ..supabase_client import get_supabase
+from ..security import hash_password, needs_rehash, verify_password
+from ..supabase_client import get_supabase, run_query
 
 router = APIRouter()
 
@@ -19,15 +20,17 @@ async def register(payload: RegisterRequest):
     try:
         supabase = get_supabase()
         user_id = str(uuid4())
-        hashed_password = hashlib.sha256(payload.password.encode("utf-8")).hexdigest()
-        supabase.table("users").insert(
-            {
-                "id": user_id,
-                "email": payload.email,
-                "hashed_password": hashed_password,
-                "role": payload.role,
-            }
-        ).execute()
+        hashed_password = await asyncio.to_thread(hash_password, payload.password)
+        await run_query(
+            supabase.table("users").insert(
+                {
+                    "id": user_id,
+                    "email": payload.email,
+                    "hashed_password": hashed_password,
+                    "role": payload.role,
+                }
+            )
+        )
         return {"status": "ok", "user_id": user_id}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -42,19 +45,28 @@ class LoginRequest(BaseModel):
 async def login(payload: LoginRequest):
     try:
         supabase = get_supabase()
-        result = (
+        result = await run_query(
             supabase.table("users")
             .select("id, hashed_password")
             .eq("email", payload.email)
             .limit(1)
-            .execute()
         )
-        if not result.data:
+        if not result:
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        user = result.data[0]
-        hashed_password = hashlib.sha256(payload.password.encode("utf-8")).hexdigest()
-        if user["hashed_password"] != hashed_password:
+        user = result[0]
+        verified = await asyncio.to_thread(
+            verify_password, payload.password, user["hashed_password"]
+        )
+        if not verified:
             raise HTTPException(status_code=401, detail="Invalid credentials")
+        if needs_rehash(user["hashed_password"]):
+            # Upgrade legacy sha256 rows now that the plaintext is known.
+            upgraded = await asyncio.to_thread(hash_password, payload.password)
+            await run_query(
+                supabase.table("users")
+                .update({"hashed_password": upgraded})
+                .eq("id", user["id"])
+            )
         return {"status": "ok", "user_id": user["id"]}
     except HTTPException:
         raise
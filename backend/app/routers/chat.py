@@ -4,19 +4,24 @@ import os
 import re
 import uuid
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from functools import lru_cache
 from typing import Generator
 
+import orjson
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from openai import OpenAI
 from pydantic import BaseModel, Field
 
+from ..cache import TTLCache, template_list_cache
 from ..supabase_client import get_supabase
 
 # Thread pool for parallel I/O operations
 _executor = ThreadPoolExecutor(max_workers=4)
 
+# Per-user thread lists, dropped whenever one of the user's threads is created or touched.
+_thread_list_cache = TTLCache(maxsize=2048, ttl=30)
+
 router = APIRouter()
 
 
@@ -275,13 +280,13 @@ def _get_client() -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
-def _touch_thread(supabase, thread_id: str) -> None:
-    now = datetime.utcnow().isoformat()
-    supabase.table("chat_threads").update(
-        {"updated_at": now, "last_message_at": now}
-    ).eq("id", thread_id).execute()
+def _touch_thread(supabase, thread_id: str, user_id: str) -> None:
+    supabase.rpc("touch_chat_thread", {"thread_id": thread_id}).execute()
+    _thread_list_cache.pop(user_id)
 
 
+# Pure function of the id string; memoized since it runs on most requests.
+@lru_cache(maxsize=4096)
 def _normalize_user_id(user_id: str) -> str:
     try:
         return str(uuid.UUID(user_id))
@@ -336,31 +341,17 @@ def _get_latest_checkin(supabase, user_id: str) -> dict | None:
     return result[0] if result else None
 
 
-def _get_recent_workouts(supabase, user_id: str) -> dict:
-    sessions = (
-        supabase.table("workout_sessions")
-        .select("id,template_id,status,duration_seconds,created_at,completed_at")
-        .eq("user_id", user_id)
-        .order("created_at", desc=True)
-        .limit(5)
+def _get_recent_workouts(supabase, user_id: str) -> list[dict]:
+    # Summarized server-side: last sessions with their top sets only.
+    return (
+        supabase.rpc(
+            "recent_workout_summary",
+            {"uid": user_id, "session_limit": 3, "top_set_limit": 3},
+        )
         .execute()
         .data
         or []
     )
-    session_ids = [session.get("id") for session in sessions if session.get("id")]
-    logs = []
-    if session_ids:
-        logs = (
-            supabase.table("exercise_logs")
-            .select("session_id,exercise_name,sets,reps,weight,notes,created_at")
-            .in_("session_id", session_ids)
-            .order("created_at", desc=True)
-            .limit(30)
-            .execute()
-            .data
-            or []
-        )
-    return {"sessions": sessions, "logs": logs}
 
 
 def _get_recent_prs(supabase, user_id: str) -> list[dict]:
@@ -728,12 +719,17 @@ def _get_active_workout_session(supabase, user_id: str) -> dict | None:
     return session
 
 
-def _build_user_context(supabase, user_id: str, local_workout_snapshot: dict | None = None) -> str:
+def _build_user_context(supabase, user_id: str, local_workout_snapshot: dict | None = None) -> dict:
     profile = _get_profile(supabase, user_id)
     preferences = profile.get("preferences") if profile else None
     gender = None
     if isinstance(preferences, dict):
         gender = preferences.get("gender") or preferences.get("sex")
+        # Photo URLs add prompt tokens without helping the coach.
+        preferences = {key: value for key, value in preferences.items() if key != "starting_photos"}
+    latest_checkin = _get_latest_checkin(supabase, user_id)
+    if latest_checkin and isinstance(latest_checkin.get("ai_summary"), dict):
+        latest_checkin["ai_summary"] = latest_checkin["ai_summary"].get("parsed")
     if not gender and profile:
         gender = profile.get("sex")
     
@@ -750,7 +746,7 @@ def _build_user_context(supabase, user_id: str, local_workout_snapshot: dict | N
             "preferences": preferences,
         },
         "macro_targets": profile.get("macros") if profile else None,
-        "latest_checkin": _get_latest_checkin(supabase, user_id),
+        "latest_checkin": latest_checkin,
         "recent_workouts": _get_recent_workouts(supabase, user_id),
         "recent_prs": _get_recent_prs(supabase, user_id),
         "nutrition_last_7_days": _get_nutrition_logs(supabase, user_id),
@@ -758,7 +754,7 @@ def _build_user_context(supabase, user_id: str, local_workout_snapshot: dict | N
         "active_workout_session": _get_active_workout_session(supabase, user_id),
         "device_active_workout": local_workout_snapshot,
     }
-    return json.dumps(context_payload, default=str)
+    return context_payload
 
 
 def _moderate_text(client: OpenAI, text: str) -> list[str]:
@@ -887,6 +883,63 @@ def _parse_workout_request(text: str) -> tuple[str, list[str], int]:
     return focus, muscle_groups, duration_minutes
 
 
+# Exercise catalog ids by name. Names are unique and rows are never deleted, so
+# an id stays valid; the TTL only bounds how long a worker holds it.
+_exercise_ids = TTLCache(maxsize=2048, ttl=86_400)
+
+
+def _resolve_exercise_ids(supabase, names: list[str], muscle_groups: list[str]) -> dict[str, str]:
+    """Map exercise names to ids with one lookup and one bulk insert for new names."""
+    name_to_id: dict[str, str] = {}
+    unknown: list[str] = []
+    for name in dict.fromkeys(names):
+        exercise_id = _exercise_ids.get(name)
+        if exercise_id:
+            name_to_id[name] = exercise_id
+        else:
+            unknown.append(name)
+    if not unknown:
+        return name_to_id
+    existing = (
+        supabase.table("exercises")
+        .select("id,name")
+        .in_("name", unknown)
+        .execute()
+        .data
+    )
+    for row in existing or []:
+        name_to_id.setdefault(row["name"], row["id"])
+    missing = [name for name in unknown if name not in name_to_id]
+    if missing:
+        # exercises.name is unique; names inserted concurrently are re-read.
+        created = (
+            supabase.table("exercises")
+            .upsert(
+                [
+                    {"name": name, "muscle_groups": muscle_groups, "equipment": []}
+                    for name in missing
+                ],
+                on_conflict="name",
+                ignore_duplicates=True,
+            )
+            .execute()
+            .data
+        )
+        for row in created or []:
+            name_to_id[row["name"]] = row["id"]
+        raced = [name for name in missing if name not in name_to_id]
+        if raced:
+            for row in (
+                supabase.table("exercises").select("id,name").in_("name", raced).execute().data
+                or []
+            ):
+                name_to_id[row["name"]] = row["id"]
+    for name in unknown:
+        if name in name_to_id:
+            _exercise_ids.set(name, name_to_id[name])
+    return name_to_id
+
+
 def _create_coach_workout(
     supabase, user_id: str, focus: str, muscle_groups: list[str], duration_minutes: int = 45
 ) -> dict:
@@ -932,37 +985,16 @@ def _create_coach_workout(
             return {"success": False, "error": "Failed to save workout template"}
         
         template_id = template_rows[0]["id"]
+        template_list_cache.pop(user_id)
         
         # Add exercises to the template
         exercises = workout_data.get("exercises", [])
-        for idx, exercise in enumerate(exercises):
-            exercise_name = exercise.get("name", "Unknown Exercise")
-            
-            # Get or create exercise in exercises table
-            existing = (
-                supabase.table("exercises")
-                .select("id")
-                .eq("name", exercise_name)
-                .limit(1)
-                .execute()
-                .data
-            )
-            
-            if existing:
-                exercise_id = existing[0]["id"]
-            else:
-                created = (
-                    supabase.table("exercises")
-                    .insert({
-                        "name": exercise_name,
-                        "muscle_groups": muscle_groups,
-                        "equipment": [],
-                    })
-                    .execute()
-                    .data
-                )
-                exercise_id = created[0]["id"] if created else None
-            
+        names = [exercise.get("name", "Unknown Exercise") for exercise in exercises]
+        exercise_ids = _resolve_exercise_ids(supabase, names, muscle_groups)
+        
+        link_rows = []
+        for idx, (exercise, exercise_name) in enumerate(zip(exercises, names)):
+            exercise_id = exercise_ids.get(exercise_name)
             if exercise_id:
                 # Handle reps that might be a string like "8-10"
                 reps_val = exercise.get("reps", 10)
@@ -970,7 +1002,7 @@ def _create_coach_workout(
                     # Take the lower number from range like "8-10"
                     reps_val = int(reps_val.split("-")[0]) if "-" in reps_val else int(reps_val)
                 
-                supabase.table("workout_template_exercises").insert({
+                link_rows.append({
                     "template_id": template_id,
                     "exercise_id": exercise_id,
                     "position": idx,
@@ -978,7 +1010,9 @@ def _create_coach_workout(
                     "reps": reps_val,
                     "rest_seconds": exercise.get("rest_seconds", 60),
                     "notes": exercise.get("notes"),
-                }).execute()
+                })
+        if link_rows:
+            supabase.table("workout_template_exercises").insert(link_rows).execute()
         
         return {
             "success": True,
@@ -1152,6 +1186,15 @@ def _assistant_metadata(
     return json.dumps(payload)
 
 
+def _sse(*frames: str) -> str:
+    # Pack consecutive frames into one chunk so they go out in a single write.
+    return "".join(f"data: {frame}\n\n" for frame in frames)
+
+
+def _coach_action_event(action_proposal: dict) -> str:
+    return orjson.dumps({"type": "coach_action", "action": action_proposal}).decode()
+
+
 @router.post("/thread")
 async def create_thread(payload: CreateThreadRequest):
     supabase = get_supabase()
@@ -1165,22 +1208,26 @@ async def create_thread(payload: CreateThreadRequest):
     )
     if not row:
         raise HTTPException(status_code=500, detail="Failed to create thread")
+    _thread_list_cache.pop(user_id)
     return {"thread": row[0]}
 
 
 @router.get("/threads")
 async def list_threads(user_id: str):
-    supabase = get_supabase()
     normalized_user_id = _normalize_user_id(user_id)
-    threads = (
-        supabase.table("chat_threads")
-        .select("*")
-        .eq("user_id", normalized_user_id)
-        .order("last_message_at", desc=True)
-        .execute()
-        .data
-        or []
-    )
+    threads = _thread_list_cache.get(normalized_user_id)
+    if threads is None:
+        supabase = get_supabase()
+        threads = (
+            supabase.table("chat_threads")
+            .select("*")
+            .eq("user_id", normalized_user_id)
+            .order("last_message_at", desc=True)
+            .execute()
+            .data
+            or []
+        )
+        _thread_list_cache.set(normalized_user_id, threads)
     return {"threads": threads}
 
 
@@ -1219,27 +1266,30 @@ async def post_message(payload: PostMessageRequest):
     
     supabase = get_supabase()
     user_id = _normalize_user_id(payload.user_id)
-    
+    client = _get_client()
+    loop = asyncio.get_running_loop()
+
     # Verify thread exists (lightweight query first)
-    thread_rows = (
-        supabase.table("chat_threads")
-        .select("id")
-        .eq("id", payload.thread_id)
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-        .data
-    )
+    def fetch_thread_rows():
+        return (
+            supabase.table("chat_threads")
+            .select("id")
+            .eq("id", payload.thread_id)
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+            .data
+        )
+    thread_rows = await loop.run_in_executor(_executor, fetch_thread_rows)
     if not thread_rows:
         raise HTTPException(status_code=404, detail="Thread not found")
-    
-    client = _get_client()
-    loop = asyncio.get_event_loop()
-    
-    # Run moderation and context building in parallel for faster response
+
+    # Moderation overlaps the user-message insert and context reads below.
     moderation_future = loop.run_in_executor(
         _executor, _moderate_text, client, payload.content
     )
+
+    # Build context in parallel with moderation for faster response
     context_future = loop.run_in_executor(
         _executor, _build_user_context, supabase, user_id, payload.local_workout_snapshot
     )
@@ -1263,7 +1313,7 @@ async def post_message(payload: PostMessageRequest):
                 "content": payload.content,
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
+        _touch_thread(supabase, payload.thread_id, user_id)
     loop.run_in_executor(_executor, insert_user_message)
     
     # Wait for moderation first (critical path)
@@ -1279,11 +1329,10 @@ async def post_message(payload: PostMessageRequest):
                 "safety_flags": flags,
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
+        _touch_thread(supabase, payload.thread_id, user_id)
         if payload.stream:
             def refusal_stream() -> Generator[str, None, None]:
-                yield f"data: {refusal_text}\n\n"
-                yield "data: [DONE]\n\n"
+                yield _sse(refusal_text, "[DONE]")
             return StreamingResponse(refusal_stream(), media_type="text/event-stream")
         return {"reply": refusal_text}
 
@@ -1317,7 +1366,7 @@ async def post_message(payload: PostMessageRequest):
                 "metadata": json.dumps({"workout_created": workout_result}),
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
+        _touch_thread(supabase, payload.thread_id, user_id)
         return {"reply": assistant_text, "workout_created": workout_result}
 
     if workout_request and payload.stream:
@@ -1325,7 +1374,7 @@ async def post_message(payload: PostMessageRequest):
 
         def stream_workout_response() -> Generator[str, None, None]:
             assistant_text = "One moment while I build your workout."
-            yield f"data: {assistant_text}\n\n"
+            yield _sse(assistant_text)
 
             workout_result = _create_coach_workout(
                 supabase,
@@ -1341,7 +1390,7 @@ async def post_message(payload: PostMessageRequest):
                 tail = " Workout failed. Tell me your goal and equipment."
 
             assistant_text += tail
-            yield f"data: {tail}\n\n"
+            yield _sse(tail)
 
             supabase.table("chat_messages").insert(
                 {
@@ -1353,22 +1402,15 @@ async def post_message(payload: PostMessageRequest):
                     "metadata": json.dumps({"workout_created": workout_result}),
                 }
             ).execute()
-            _touch_thread(supabase, payload.thread_id)
-            yield "data: [DONE]\n\n"
+            _touch_thread(supabase, payload.thread_id, user_id)
+            yield _sse("[DONE]")
 
         return StreamingResponse(stream_workout_response(), media_type="text/event-stream")
     
     # Now wait for context (was running in parallel)
-    context_blob, history_rows, summary = await asyncio.gather(
+    context_payload, history_rows, summary = await asyncio.gather(
         context_future, history_future, summary_future
     )
-    context_payload = {}
-    try:
-        parsed_context = json.loads(context_blob)
-        if isinstance(parsed_context, dict):
-            context_payload = parsed_context
-    except (TypeError, json.JSONDecodeError):
-        context_payload = {}
     latest_action_proposal = _extract_latest_action_proposal(history_rows)
     history = _history_for_model(history_rows)
 
@@ -1386,9 +1428,7 @@ async def post_message(payload: PostMessageRequest):
 
         if payload.stream:
             def stream_action_confirmation() -> Generator[str, None, None]:
-                yield f"data: {assistant_text}\n\n"
-                action_event = json.dumps({"type": "coach_action", "action": latest_action_proposal})
-                yield f"data: {action_event}\n\n"
+                yield _sse(assistant_text, _coach_action_event(latest_action_proposal))
                 supabase.table("chat_messages").insert(
                     {
                         "thread_id": payload.thread_id,
@@ -1399,8 +1439,8 @@ async def post_message(payload: PostMessageRequest):
                         "metadata": assistant_metadata,
                     }
                 ).execute()
-                _touch_thread(supabase, payload.thread_id)
-                yield "data: [DONE]\n\n"
+                _touch_thread(supabase, payload.thread_id, user_id)
+                yield _sse("[DONE]")
 
             return StreamingResponse(stream_action_confirmation(), media_type="text/event-stream")
 
@@ -1414,7 +1454,7 @@ async def post_message(payload: PostMessageRequest):
                 "metadata": assistant_metadata,
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
+        _touch_thread(supabase, payload.thread_id, user_id)
         return {"reply": assistant_text, "coach_action": latest_action_proposal}
 
     if _is_action_confirmation(payload.content):
@@ -1433,9 +1473,7 @@ async def post_message(payload: PostMessageRequest):
 
             if payload.stream:
                 def stream_inferred_action_confirmation() -> Generator[str, None, None]:
-                    yield f"data: {assistant_text}\n\n"
-                    action_event = json.dumps({"type": "coach_action", "action": inferred_macro_proposal})
-                    yield f"data: {action_event}\n\n"
+                    yield _sse(assistant_text, _coach_action_event(inferred_macro_proposal))
                     supabase.table("chat_messages").insert(
                         {
                             "thread_id": payload.thread_id,
@@ -1446,8 +1484,8 @@ async def post_message(payload: PostMessageRequest):
                             "metadata": assistant_metadata,
                         }
                     ).execute()
-                    _touch_thread(supabase, payload.thread_id)
-                    yield "data: [DONE]\n\n"
+                    _touch_thread(supabase, payload.thread_id, user_id)
+                    yield _sse("[DONE]")
 
                 return StreamingResponse(stream_inferred_action_confirmation(), media_type="text/event-stream")
 
@@ -1461,9 +1499,10 @@ async def post_message(payload: PostMessageRequest):
                     "metadata": assistant_metadata,
                 }
             ).execute()
-            _touch_thread(supabase, payload.thread_id)
+            _touch_thread(supabase, payload.thread_id, user_id)
             return {"reply": assistant_text, "coach_action": inferred_macro_proposal}
     
+    context_blob = orjson.dumps(context_payload, default=str).decode()
     context_message = "User Context (server-trusted + device snapshot): " + context_blob
     if summary:
         context_message += f"\nThread Summary: {summary}"
@@ -1520,7 +1559,7 @@ async def post_message(payload: PostMessageRequest):
                 ),
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
+        _touch_thread(supabase, payload.thread_id, user_id)
         return {
             "reply": assistant_text,
             "workout_created": workout_result,
@@ -1553,10 +1592,10 @@ async def post_message(payload: PostMessageRequest):
             max_words=trim_max_words,
             max_sentences=trim_max_sentences,
         )
-        yield f"data: {assistant_text}\n\n"
+        frames = [assistant_text]
         if action_proposal:
-            action_event = json.dumps({"type": "coach_action", "action": action_proposal})
-            yield f"data: {action_event}\n\n"
+            frames.append(_coach_action_event(action_proposal))
+        yield _sse(*frames)
         
         # Save the message
         supabase.table("chat_messages").insert(
@@ -1572,7 +1611,7 @@ async def post_message(payload: PostMessageRequest):
                 ),
             }
         ).execute()
-        _touch_thread(supabase, payload.thread_id)
-        yield "data: [DONE]\n\n"
+        _touch_thread(supabase, payload.thread_id, user_id)
+        yield _sse("[DONE]")
     
     return StreamingResponse(stream_response(), media_type="text/event-stream")
@@ -1,127 +1,100 @@
+import asyncio
 import os
-from datetime import date, datetime
+from datetime import date
+from functools import lru_cache
+from itertools import chain
 from urllib.parse import unquote, urlparse
 
 from fastapi import APIRouter, HTTPException
+from postgrest import SyncFilterRequestBuilder
 
-from ..prompts import parse_json_output, run_prompt
-from ..supabase_client import get_supabase
+from ..cache import profile_cache, starting_photo_cache
+from ..prompts import (
+    clean_photo_url,
+    extract_photo_urls,
+    parse_json_output,
+    run_prompt,
+)
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 PHOTO_RETENTION_STORE = "store"
 PHOTO_RETENTION_DELETE_AFTER_SCAN = "delete_after_scan"
+_MACRO_KEYS = ("calories", "protein", "carbs", "fats")
 
 
 def _to_number(value: int | float | str | None) -> int | None:
     if value is None:
         return None
+    if type(value) is int:
+        return value
     if isinstance(value, (int, float)):
-        return int(round(value))
+        return round(value)
+    if isinstance(value, str):
+        value = value.strip()
+        digits = value[1:] if value[:1] == "-" else value
+        if digits.isdecimal():
+            return int(value)
     try:
-        return int(round(float(value)))
+        return round(float(value))
     except ValueError:
         return None
 
 
-def _normalize_macros(raw_macros: dict | None) -> dict | None:
-    if not isinstance(raw_macros, dict):
-        return None
-    calories = _to_number(raw_macros.get("calories"))
-    protein = _to_number(raw_macros.get("protein"))
-    carbs = _to_number(raw_macros.get("carbs"))
-    fats = _to_number(raw_macros.get("fats"))
-    if None in (calories, protein, carbs, fats):
-        return None
-    return {"calories": calories, "protein": protein, "carbs": carbs, "fats": fats}
-
-
 def _normalize_macro_delta(raw_delta: dict | None) -> dict:
     if not isinstance(raw_delta, dict):
         return {}
-    return {
-        "calories": _to_number(raw_delta.get("calories")) or 0,
-        "protein": _to_number(raw_delta.get("protein")) or 0,
-        "carbs": _to_number(raw_delta.get("carbs")) or 0,
-        "fats": _to_number(raw_delta.get("fats")) or 0,
-    }
-
-
-def _apply_macro_delta(current: dict, delta: dict) -> dict:
-    updated = {}
-    for key in ("calories", "protein", "carbs", "fats"):
-        updated[key] = max(0, (current.get(key) or 0) + (delta.get(key) or 0))
-    if updated["calories"] < 1200:
-        updated["calories"] = 1200
-    return updated
-
-
-def _clean_photo_url(value) -> str | None:
-    if not isinstance(value, str):
-        return None
-    trimmed = value.strip()
-    return trimmed or None
+    get = raw_delta.get
+    return {key: _to_number(get(key)) or 0 for key in _MACRO_KEYS}
 
 
-def _extract_photo_urls(value) -> list[str]:
-    if not isinstance(value, list):
-        return []
-    urls: list[str] = []
-    for item in value:
-        if isinstance(item, str):
-            cleaned = _clean_photo_url(item)
-        elif isinstance(item, dict):
-            cleaned = _clean_photo_url(item.get("url"))
-        else:
-            cleaned = None
-        if cleaned:
-            urls.append(cleaned)
-    return urls
-
-
-def _extract_photo_items(value, default_date: str | None = None) -> list[dict]:
-    if not isinstance(value, list):
-        return []
-    items: list[dict] = []
-    for item in value:
-        if isinstance(item, str):
-            cleaned_url = _clean_photo_url(item)
-            photo_type = None
-            photo_date = default_date
-        elif isinstance(item, dict):
-            cleaned_url = _clean_photo_url(item.get("url"))
-            photo_type = item.get("type") if isinstance(item.get("type"), str) else None
-            raw_date = item.get("date")
-            photo_date = raw_date.strip() if isinstance(raw_date, str) and raw_date.strip() else default_date
-        else:
-            cleaned_url = None
-            photo_type = None
-            photo_date = default_date
-
-        if not cleaned_url:
+def _normalize_photos(
+    photos, fallback_urls, default_date: str | None, seen: set[str]
+) -> tuple[list[dict], list[str]]:
+    # One pass per source: builds the stored photo items and the deduped prompt
+    # URLs together. `fallback_urls` is only used when `photos` yields nothing.
+    for source in (photos, fallback_urls):
+        if not isinstance(source, list):
             continue
-
-        photo_item = {"url": cleaned_url}
-        if photo_type:
-            photo_item["type"] = photo_type
-        if photo_date:
-            photo_item["date"] = photo_date
-        items.append(photo_item)
-    return items
-
-
-def _extract_starting_photo_urls(value) -> list[str]:
+        items: list[dict] = []
+        urls: list[str] = []
+        for item in source:
+            if isinstance(item, str):
+                cleaned_url = clean_photo_url(item)
+                photo_type = None
+                photo_date = default_date
+            elif isinstance(item, dict):
+                cleaned_url = clean_photo_url(item.get("url"))
+                photo_type = item.get("type") if isinstance(item.get("type"), str) else None
+                raw_date = item.get("date")
+                photo_date = raw_date.strip() if isinstance(raw_date, str) and raw_date.strip() else default_date
+            else:
+                continue
+
+            if not cleaned_url:
+                continue
+
+            photo_item = {"url": cleaned_url}
+            if photo_type:
+                photo_item["type"] = photo_type
+            if photo_date:
+                photo_item["date"] = photo_date
+            items.append(photo_item)
+            if cleaned_url not in seen:
+                seen.add(cleaned_url)
+                urls.append(cleaned_url)
+        if items:
+            return items, urls
+    return [], []
+
+
+def _extract_starting_photo_urls(value, seen: set[str] | None = None) -> list[str]:
     if not isinstance(value, dict):
         return []
-    urls: list[str] = []
-    for key in ("front", "side", "back"):
-        entry = value.get(key)
-        if not isinstance(entry, dict):
-            continue
-        cleaned = _clean_photo_url(entry.get("url"))
-        if cleaned:
-            urls.append(cleaned)
-    return urls
+    entries = [value.get(key) for key in ("front", "side", "back")]
+    return extract_photo_urls([entry for entry in entries if isinstance(entry, dict)], seen)
 
 def _preference_string(preferences: dict | None, keys: tuple[str, ...]) -> str | None:
     if not isinstance(preferences, dict):
@@ -151,58 +124,52 @@ def _preference_string_array(preferences: dict | None, keys: tuple[str, ...]) ->
             return cleaned
     return []
 
+# Older postgrest builders lack .contains(); probe the builder class once.
+_SUPPORTS_CONTAINS = hasattr(SyncFilterRequestBuilder, "contains")
+
+
 def _filter_by_tag(query, tag: str):
-    if hasattr(query, "contains"):
+    if _SUPPORTS_CONTAINS:
         return query.contains("tags", [tag])
     return query.filter("tags", "cs", f"{{{tag}}}")
 
 
-def _dedupe_urls(urls: list[str]) -> list[str]:
-    seen: set[str] = set()
-    result: list[str] = []
-    for url in urls:
-        if url in seen:
-            continue
-        seen.add(url)
-        result.append(url)
-    return result
+@lru_cache(maxsize=8)
+def _public_url_markers(bucket: str) -> tuple[str, ...]:
+    return (
+        f"/storage/v1/object/public/{bucket}/",
+        f"/object/public/{bucket}/",
+    )
 
 
 def _extract_storage_path_from_public_url(photo_url: str, bucket: str) -> str | None:
-    parsed = urlparse(photo_url)
-    if not parsed.path:
+    url_path = urlparse(photo_url).path
+    if not url_path:
         return None
-    markers = (
-        f"/storage/v1/object/public/{bucket}/",
-        f"/object/public/{bucket}/",
-    )
-    for marker in markers:
-        index = parsed.path.find(marker)
-        if index == -1:
-            continue
-        path = parsed.path[index + len(marker) :]
-        if path:
+    for marker in _public_url_markers(bucket):
+        _, found, path = url_path.partition(marker)
+        if found and path:
             return unquote(path)
     return None
 
 
 def _delete_checkin_photo_assets(supabase, user_id: str, urls: list[str]) -> None:
-    cleaned_urls = _dedupe_urls(_extract_photo_urls(urls))
+    cleaned_urls = list(dict.fromkeys(extract_photo_urls(urls)))
     if not cleaned_urls:
         return
+    starting_photo_cache.pop(user_id)
 
-    for photo_url in cleaned_urls:
-        try:
-            (
-                supabase.table("progress_photos")
-                .delete()
-                .eq("user_id", user_id)
-                .eq("url", photo_url)
-                .execute()
-            )
-        except Exception:
-            # Best effort cleanup; rows might not exist for temporary uploads.
-            continue
+    try:
+        (
+            supabase.table("progress_photos")
+            .delete()
+            .eq("user_id", user_id)
+            .in_("url", cleaned_urls)
+            .execute()
+        )
+    except Exception:
+        # Best effort cleanup; rows might not exist for temporary uploads.
+        pass
 
     bucket = os.environ.get("SUPABASE_PROGRESS_PHOTO_BUCKET", "progress-photos")
     paths = [
@@ -220,7 +187,22 @@ def _delete_checkin_photo_assets(supabase, user_id: str, urls: list[str]) -> Non
         pass
 
 
-def _get_previous_checkin_photo_urls(supabase, user_id: str, checkin_date: str) -> list[str]:
+def _get_checkin_profile(supabase, user_id: str) -> dict:
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return cached
+    profile_rows = (
+        supabase.table("profiles")
+        .select("goal,preferences")
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+        .data
+    )
+    return profile_rows[0] if profile_rows else {}
+
+
+def _get_previous_checkin_photos(supabase, user_id: str, checkin_date: str) -> list:
     if not checkin_date:
         return []
     result = (
@@ -235,37 +217,22 @@ def _get_previous_checkin_photo_urls(supabase, user_id: str, checkin_date: str)
     )
     if not result:
         return []
-    return _extract_photo_urls(result[0].get("photos"))
+    return result[0].get("photos") or []
 
 
-def _get_starting_photo_urls(supabase, user_id: str, preferences: dict | None = None) -> list[str]:
-    resolved_preferences = preferences if isinstance(preferences, dict) else None
-    if resolved_preferences is None:
-        profile_rows = (
-            supabase.table("profiles")
-            .select("preferences")
-            .eq("user_id", user_id)
-            .limit(1)
-            .execute()
-            .data
-        )
-        resolved_preferences = profile_rows[0].get("preferences") if profile_rows else None
-    starting = (
-        resolved_preferences.get("starting_photos")
-        if isinstance(resolved_preferences, dict)
-        else None
-    )
-    starting_urls = _extract_starting_photo_urls(starting)
-    if starting_urls:
-        return starting_urls
+def _get_tagged_starting_photos(supabase, user_id: str) -> list[dict]:
+    cached = starting_photo_cache.get(user_id)
+    if cached is not None:
+        return cached
     query = (
         supabase.table("progress_photos")
         .select("url,tags")
         .eq("user_id", user_id)
     )
     query = _filter_by_tag(query, "category:starting")
-    photo_rows = query.limit(3).execute().data
-    return _extract_photo_urls(photo_rows)
+    photo_rows = query.limit(3).execute().data or []
+    starting_photo_cache.set(user_id, photo_rows)
+    return photo_rows
 
 
 @router.get("/")
@@ -281,8 +248,8 @@ async def list_checkins(
         query = query.gte("date", start_date)
     if end_date:
         query = query.lte("date", end_date)
-    result = query.order("date", desc=True).limit(limit).execute().data
-    return {"checkins": result}
+    result = await run_query(query.order("date", desc=True).limit(limit))
+    return ORJSONResponse({"checkins": result})
 
 
 @router.post("/")
@@ -295,35 +262,34 @@ async def submit_checkin(
     checkin_date: str | None = None,
 ):
     supabase = get_supabase()
-    profile_rows = (
-        supabase.table("profiles")
-        .select("goal,preferences")
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-        .data
-    )
-    profile = profile_rows[0] if profile_rows else {}
-    preferences = profile.get("preferences") if isinstance(profile, dict) else None
     date_value = checkin_date or date.today().isoformat()
     retention_value = (photo_retention or PHOTO_RETENTION_STORE).strip().lower()
     if retention_value not in {PHOTO_RETENTION_STORE, PHOTO_RETENTION_DELETE_AFTER_SCAN}:
         retention_value = PHOTO_RETENTION_STORE
 
     keep_photos = retention_value != PHOTO_RETENTION_DELETE_AFTER_SCAN
-    photo_list = _extract_photo_items(photos, default_date=date_value)
-    fallback_urls = _extract_photo_urls(photo_urls or [])
-    prompt_urls = _extract_photo_urls(photo_list) or _extract_photo_urls(fallback_urls)
-    prompt_urls = _dedupe_urls(prompt_urls)
-    comparison_urls = _get_previous_checkin_photo_urls(supabase, user_id, date_value)
+    # Shared across prompt and comparison extraction so each URL is sent once.
+    seen_urls: set[str] = set()
+    stored_photos, prompt_urls = _normalize_photos(photos, photo_urls, date_value, seen_urls)
+    # All three photo sources are independent reads, so fetch them together
+    # and pick the first non-empty one afterwards.
+    profile, previous_photos, tagged_starting_photos = await asyncio.gather(
+        asyncio.to_thread(_get_checkin_profile, supabase, user_id),
+        asyncio.to_thread(_get_previous_checkin_photos, supabase, user_id, date_value),
+        asyncio.to_thread(_get_tagged_starting_photos, supabase, user_id),
+    )
+    preferences = profile.get("preferences")
     comparison_source = None
+    comparison_urls = extract_photo_urls(previous_photos, seen_urls)
     if comparison_urls:
         comparison_source = "previous_checkin"
     else:
-        comparison_urls = _get_starting_photo_urls(supabase, user_id, preferences)
+        starting = preferences.get("starting_photos") if isinstance(preferences, dict) else None
+        comparison_urls = _extract_starting_photo_urls(starting, seen_urls) or extract_photo_urls(
+            tagged_starting_photos, seen_urls
+        )
         if comparison_urls:
             comparison_source = "starting_photos"
-    comparison_urls = [url for url in comparison_urls if url not in prompt_urls]
     prompt_input = {"adherence": adherence, "photo_urls": prompt_urls}
     if profile.get("goal"):
         prompt_input["goal"] = profile.get("goal")
@@ -333,11 +299,15 @@ async def submit_checkin(
         physique_priority = legacy_physique_focus[0]
     if physique_priority:
         prompt_input["physique_priority"] = physique_priority
-    secondary_goals = _preference_string_array(preferences, ("secondaryGoals", "secondary_goals"))
-    secondary_goals.extend(legacy_physique_focus[1:])
-    secondary_goals = list(dict.fromkeys(
-        goal for goal in secondary_goals if goal and goal != physique_priority
-    ))
+    secondary_goals: list[str] = []
+    seen_goals = {physique_priority} if physique_priority else set()
+    for goal in chain(
+        _preference_string_array(preferences, ("secondaryGoals", "secondary_goals")),
+        legacy_physique_focus[1:],
+    ):
+        if goal and goal not in seen_goals:
+            seen_goals.add(goal)
+            secondary_goals.append(goal)
     if secondary_goals:
         prompt_input["secondary_goals"] = secondary_goals
     physique_goal_description = _preference_string(preferences, ("physiqueGoalDescription", "physique_goal_description"))
@@ -353,7 +323,9 @@ async def submit_checkin(
         if comparison_source:
             prompt_input["comparison_source"] = comparison_source
     try:
-        ai_output = run_prompt("weekly_checkin_analysis", user_id=user_id, inputs=prompt_input)
+        ai_output = await asyncio.to_thread(
+            run_prompt, "weekly_checkin_analysis", user_id=user_id, inputs=prompt_input
+        )
         parsed_output = {}
         try:
             parsed_output = parse_json_output(ai_output)
@@ -364,53 +336,24 @@ async def submit_checkin(
         update_macros = bool(parsed_output.get("update_macros")) or any(
             value != 0 for value in macro_delta.values()
         )
-        updated_macros = None
-        macro_applied = False
-
-        if update_macros:
-            profile_rows = (
-                supabase.table("profiles")
-                .select("macros")
-                .eq("user_id", user_id)
-                .limit(1)
-                .execute()
-                .data
-            )
-            current_macros = _normalize_macros(profile_rows[0].get("macros")) if profile_rows else None
-            if current_macros:
-                updated_macros = _apply_macro_delta(current_macros, macro_delta)
-                supabase.table("profiles").upsert(
-                    {
-                        "user_id": user_id,
-                        "macros": updated_macros,
-                        "updated_at": datetime.utcnow().isoformat(),
-                    },
-                    on_conflict="user_id",
-                ).execute()
-                macro_applied = True
 
         if not keep_photos and prompt_urls:
-            _delete_checkin_photo_assets(supabase, user_id, prompt_urls)
-
-        stored_photos = photo_list or [{"url": url, "date": date_value} for url in fallback_urls]
+            await asyncio.to_thread(_delete_checkin_photo_assets, supabase, user_id, prompt_urls)
 
         checkin_payload = {
-            "user_id": user_id,
-            "date": date_value,
+            "uid": user_id,
+            "checkin_date": date_value,
             "weight": adherence.get("current_weight"),
             "adherence": adherence,
             "photos": stored_photos if keep_photos else [],
             "ai_summary": {"raw": ai_output, "parsed": parsed_output},
-            "macro_update": {
-                "suggested": update_macros,
-                "delta": macro_delta,
-                "applied": macro_applied,
-                "new_macros": updated_macros,
-            },
+            "macro_update": {"suggested": update_macros, "delta": macro_delta},
             "cardio_update": {"suggested": True},
         }
-        inserted = supabase.table("weekly_checkins").insert(checkin_payload).execute().data or []
-        inserted_checkin = inserted[0] if inserted else checkin_payload
+        inserted_checkin = await run_query(supabase.rpc("submit_checkin_tx", checkin_payload)) or {}
+        macro_update = inserted_checkin.get("macro_update") or {}
+        if macro_update.get("applied"):
+            profile_cache.pop(user_id)
         return {
             "status": "complete",
             "ai_result": ai_output,
@@ -418,8 +361,8 @@ async def submit_checkin(
             "macro_update": {
                 "suggested": update_macros,
                 "delta": macro_delta,
-                "applied": macro_applied,
-                "new_macros": updated_macros,
+                "applied": bool(macro_update.get("applied")),
+                "new_macros": macro_update.get("new_macros"),
             },
             "photo_retention": retention_value,
         }
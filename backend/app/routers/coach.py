@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-from ..supabase_client import get_supabase
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class CoachProfileRequest(BaseModel):
@@ -17,27 +18,21 @@ class CoachProfileRequest(BaseModel):
 @router.post("/profile")
 async def upsert_coach_profile(payload: CoachProfileRequest):
     supabase = get_supabase()
-    result = (
-        supabase.table("coach_profiles")
-        .upsert(payload.dict(), on_conflict="user_id")
-        .execute()
-        .data
+    body = payload.model_dump(mode="json")
+    result = await run_query(
+        supabase.table("coach_profiles").upsert(body, on_conflict="user_id")
     )
-    if result:
-        return {"profile": result[0]}
-    return {"profile": payload.dict()}
+    return {"profile": result[0] if result else body}
 
 
 @router.get("/profile/{user_id}")
 async def get_coach_profile(user_id: str):
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("coach_profiles")
         .select("*")
         .eq("user_id", user_id)
         .limit(1)
-        .execute()
-        .data
     )
     if not result:
         raise HTTPException(status_code=404, detail="Coach profile not found")
@@ -47,5 +42,5 @@ async def get_coach_profile(user_id: str):
 @router.get("/discover")
 async def discover_coaches(limit: int = 20):
     supabase = get_supabase()
-    result = supabase.table("coach_profiles").select("*").limit(limit).execute().data
-    return {"results": result}
+    result = await run_query(supabase.table("coach_profiles").select("*").limit(limit))
+    return ORJSONResponse({"results": result})
@@ -5,17 +5,62 @@ Handles the daily check-in functionality for the streak system.
 Users complete a quick 3-question check-in to save their App Streak.
 """
 
+import asyncio
 import os
+import random
 from datetime import datetime
-from typing import Literal
+from functools import lru_cache
+from typing import Literal, TypedDict
 
-from fastapi import APIRouter, HTTPException
+import httpx
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from openai import OpenAI
 from pydantic import BaseModel
 
-from ..supabase_client import get_supabase
-
-router = APIRouter()
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+_ALL_GOOD_RESPONSES = (
+    "Perfect day yesterday! Keep that energy going today.",
+    "You're crushing it! Consistency like this builds champions.",
+    "Elite habits! Your future self is thanking you right now.",
+    "All boxes checked! This is how transformations happen.",
+)
+_MACROS_AND_TRAINING_RESPONSES = (
+    "Great work on training and nutrition! Prioritize sleep tonight.",
+    "Two out of three ain't bad! Rest up and keep building.",
+    "Solid effort! Better sleep = better gains tomorrow.",
+)
+_MACROS_ONLY_RESPONSES = (
+    "Nutrition on point! Rest day recovery is important too.",
+    "Macros hit! Even rest days are progress days.",
+    "Great job fueling right! Your body's recovering.",
+)
+_TRAINING_ONLY_RESPONSES = (
+    "Great workout! Let's dial in those macros today.",
+    "Training done! Fuel that body right and watch the gains come.",
+    "Good session! Remember: nutrition amplifies your hard work.",
+)
+_FRESH_START_RESPONSES = (
+    "New day, fresh start! Let's make today count.",
+    "Every day is a chance to build momentum. Let's go!",
+    "Progress isn't always perfect. Keep showing up!",
+    "One day at a time. You've got this!",
+)
+
+# Keyed by (hit_macros, trained, good_sleep).
+_LOCAL_RESPONSE_POOLS = {
+    (True, True, True): _ALL_GOOD_RESPONSES,
+    (True, True, False): _MACROS_AND_TRAINING_RESPONSES,
+    (True, False, True): _MACROS_ONLY_RESPONSES,
+    (True, False, False): _MACROS_ONLY_RESPONSES,
+    (False, True, True): _TRAINING_ONLY_RESPONSES,
+    (False, True, False): _TRAINING_ONLY_RESPONSES,
+    (False, False, True): _FRESH_START_RESPONSES,
+    (False, False, False): _FRESH_START_RESPONSES,
+}
 
 
 class DailyCheckInRequest(BaseModel):
@@ -25,17 +70,25 @@ class DailyCheckInRequest(BaseModel):
     sleep_quality: Literal["good", "okay", "poor"]
 
 
-class DailyCheckInResponse(BaseModel):
+class DailyCheckInResponse(TypedDict):
     coach_response: str
     streak_saved: bool
-    current_streak: int | None = None
+    current_streak: int | None
 
 
+@lru_cache(maxsize=1)
 def _get_openai_client() -> OpenAI:
+    # Built once per process so check-ins reuse the same keep-alive connection pool.
     api_key = os.environ.get("OPENAI_API_KEY", "")
     if not api_key:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY is not set")
-    return OpenAI(api_key=api_key)
+    return OpenAI(
+        api_key=api_key,
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        ),
+    )
 
 
 def _generate_coach_response(
@@ -83,49 +136,30 @@ def _generate_local_response(
     sleep_quality: str,
 ) -> str:
     """Generate a local response without API call."""
-    
-    trained = training_status == "trained"
-    good_sleep = sleep_quality == "good"
-    
-    if hit_macros and trained and good_sleep:
-        responses = [
-            "Perfect day yesterday! Keep that energy going today.",
-            "You're crushing it! Consistency like this builds champions.",
-            "Elite habits! Your future self is thanking you right now.",
-            "All boxes checked! This is how transformations happen.",
-        ]
-    elif hit_macros and trained:
-        responses = [
-            "Great work on training and nutrition! Prioritize sleep tonight.",
-            "Two out of three ain't bad! Rest up and keep building.",
-            "Solid effort! Better sleep = better gains tomorrow.",
-        ]
-    elif hit_macros:
-        responses = [
-            "Nutrition on point! Rest day recovery is important too.",
-            "Macros hit! Even rest days are progress days.",
-            "Great job fueling right! Your body's recovering.",
-        ]
-    elif trained:
-        responses = [
-            "Great workout! Let's dial in those macros today.",
-            "Training done! Fuel that body right and watch the gains come.",
-            "Good session! Remember: nutrition amplifies your hard work.",
-        ]
-    else:
-        responses = [
-            "New day, fresh start! Let's make today count.",
-            "Every day is a chance to build momentum. Let's go!",
-            "Progress isn't always perfect. Keep showing up!",
-            "One day at a time. You've got this!",
-        ]
-    
-    import random
-    return random.choice(responses)
+    key = (hit_macros, training_status == "trained", sleep_quality == "good")
+    return random.choice(_LOCAL_RESPONSE_POOLS[key])
+
+
+def _log_daily_checkin(request: DailyCheckInRequest, coach_response: str) -> None:
+    now = datetime.utcnow()
+    try:
+        supabase = get_supabase()
+        supabase.table("daily_checkins").insert({
+            "user_id": request.user_id,
+            "date": now.date().isoformat(),
+            "hit_macros": request.hit_macros,
+            "training_status": request.training_status,
+            "sleep_quality": request.sleep_quality,
+            "coach_response": coach_response,
+            "created_at": now.isoformat(),
+        }).execute()
+    except Exception:
+        # Don't fail the request if logging fails
+        pass
 
 
-@router.post("/daily-checkin", response_model=DailyCheckInResponse)
-async def submit_daily_checkin(request: DailyCheckInRequest):
+@router.post("/daily-checkin")
+async def submit_daily_checkin(request: DailyCheckInRequest, background_tasks: BackgroundTasks):
     """
     Submit a daily check-in to save the App Streak.
     
@@ -138,32 +172,24 @@ async def submit_daily_checkin(request: DailyCheckInRequest):
     """
     
     # Generate coach response
-    coach_response = _generate_coach_response(
+    # The OpenAI call is blocking; keep it off the event loop.
+    coach_response = await asyncio.to_thread(
+        _generate_coach_response,
         hit_macros=request.hit_macros,
         training_status=request.training_status,
         sleep_quality=request.sleep_quality,
     )
     
-    # Optionally log to database for analytics
-    try:
-        supabase = get_supabase()
-        supabase.table("daily_checkins").insert({
-            "user_id": request.user_id,
-            "date": datetime.utcnow().date().isoformat(),
-            "hit_macros": request.hit_macros,
-            "training_status": request.training_status,
-            "sleep_quality": request.sleep_quality,
-            "coach_response": coach_response,
-            "created_at": datetime.utcnow().isoformat(),
-        }).execute()
-    except Exception:
-        # Don't fail the request if logging fails
-        pass
+    # Analytics only: log after the response has been sent.
+    background_tasks.add_task(_log_daily_checkin, request, coach_response)
     
-    return DailyCheckInResponse(
-        coach_response=coach_response,
-        streak_saved=True,
-    )
+    # Outbound only, so a plain dict is enough; no pydantic round trip.
+    response: DailyCheckInResponse = {
+        "coach_response": coach_response,
+        "streak_saved": True,
+        "current_streak": None,
+    }
+    return ORJSONResponse(response)
 
 
 @router.get("/daily-checkin/status")
@@ -175,14 +201,12 @@ async def get_checkin_status(user_id: str):
         supabase = get_supabase()
         today = datetime.utcnow().date().isoformat()
         
-        result = (
+        result = await run_query(
             supabase.table("daily_checkins")
             .select("*")
             .eq("user_id", user_id)
             .eq("date", today)
             .limit(1)
-            .execute()
-            .data
         )
         
         if result:
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 
-from ..supabase_client import get_supabase
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class ExerciseCreateRequest(BaseModel):
@@ -17,10 +18,18 @@ class ExerciseCreateRequest(BaseModel):
 async def create_exercise(payload: ExerciseCreateRequest):
     supabase = get_supabase()
     try:
-        result = supabase.table("exercises").insert(payload.dict()).execute().data
-        if result:
-            return {"exercise": result[0]}
-        return {"exercise": payload.dict()}
+        body = payload.model_dump(mode="json")
+        # exercises.name is unique; an existing name returns that catalog row.
+        result = await run_query(
+            supabase.table("exercises").upsert(
+                body, on_conflict="name", ignore_duplicates=True
+            )
+        )
+        if not result:
+            result = await run_query(
+                supabase.table("exercises").select("*").eq("name", payload.name).limit(1)
+            )
+        return {"exercise": result[0] if result else body}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -28,12 +37,10 @@ async def create_exercise(payload: ExerciseCreateRequest):
 @router.get("/search")
 async def search_exercises(query: str, limit: int = 20):
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("exercises")
         .select("*")
         .ilike("name", f"%{query}%")
         .limit(limit)
-        .execute()
-        .data
     )
-    return {"query": query, "results": result}
+    return ORJSONResponse({"query": query, "results": result})
@@ -1,23 +1,32 @@
+import asyncio
 from datetime import date
-import hashlib
-import json
+from functools import lru_cache
 import os
+import secrets
 import uuid
-from urllib.parse import urlencode
-from urllib.request import urlopen
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
+import httpx
+import orjson
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel, Field
 
+from ..cache import TTLCache
 from ..prompts import run_prompt
-from ..supabase_client import get_supabase
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 from ..fatsecret_client import fatsecret_request
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 USDA_BASE_URL = "https://api.nal.usda.gov/fdc/v1"
+FATSECRET_FANOUT_TIMEOUT = 8.0
+_usda_cache = TTLCache(maxsize=10_000, ttl=600)
+# Columns the app decodes for a food item; keeps future wide columns off the wire.
+_FOOD_ITEM_COLUMNS = "id,source,name,serving,protein,carbs,fats,calories,metadata"
 
 
+# Pure function of the id string; memoized since it runs on most requests.
+@lru_cache(maxsize=4096)
 def _normalize_user_id(user_id: str | None) -> str | None:
     if not user_id:
         return None
@@ -31,84 +40,122 @@ def _ensure_user_record(supabase, user_id: str | None) -> str | None:
     normalized = _normalize_user_id(user_id)
     if not normalized:
         return None
-    existing = (
-        supabase.table("users").select("id").eq("id", normalized).limit(1).execute().data
-    )
-    if existing:
-        return normalized
-
+    # Insert-if-missing in one request; an existing user row is left untouched.
     email = f"user-{normalized}@fitai.local"
-    hashed_password = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
-    supabase.table("users").insert(
+    # Placeholder accounts never log in; a random secret, not a hash of the id.
+    hashed_password = secrets.token_hex(32)
+    supabase.table("users").upsert(
         {
             "id": normalized,
             "email": email,
             "hashed_password": hashed_password,
             "role": "user",
-        }
+        },
+        on_conflict="id",
+        ignore_duplicates=True,
     ).execute()
     return normalized
 
 
+def _log_search_history(supabase, user_id: str, query: str) -> None:
+    # Runs after the response is sent; a failed history write must not surface.
+    try:
+        supabase.table("search_history").insert(
+            {"user_id": user_id, "query": query, "source": "search"}
+        ).execute()
+    except Exception:
+        pass
+
+
 @router.get("/search")
-async def search_food(query: str, user_id: str | None = None):
+async def search_food(query: str, background_tasks: BackgroundTasks, user_id: str | None = None):
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("food_items")
-        .select("*")
+        .select(_FOOD_ITEM_COLUMNS)
         .ilike("name", f"%{query}%")
         .limit(20)
-        .execute()
-        .data
     )
     normalized_user_id = _normalize_user_id(user_id) if user_id else None
     if normalized_user_id:
-        supabase.table("search_history").insert(
-            {"user_id": normalized_user_id, "query": query, "source": "search"}
-        ).execute()
-    return {"query": query, "results": result}
+        background_tasks.add_task(_log_search_history, supabase, normalized_user_id, query)
+    return ORJSONResponse({"query": query, "results": result})
 
 
-def _usda_request(path: str, params: dict) -> dict:
+@lru_cache(maxsize=1)
+def _get_usda_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(base_url=USDA_BASE_URL, timeout=10.0)
+
+
+async def close_usda_client() -> None:
+    if _get_usda_client.cache_info().currsize:
+        await _get_usda_client().aclose()
+        _get_usda_client.cache_clear()
+
+
+async def _usda_request(path: str, params: dict) -> dict:
     api_key = os.environ.get("USDA_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="USDA API key is not configured.")
+    cache_key = (path, tuple(sorted(params.items())))
+    cached = _usda_cache.get(cache_key)
+    if cached is not None:
+        return cached
     params_with_key = {"api_key": api_key, **params}
-    url = f"{USDA_BASE_URL}{path}?{urlencode(params_with_key)}"
     try:
-        with urlopen(url) as response:
-            body = response.read().decode("utf-8")
-            return json.loads(body)
+        response = await _get_usda_client().get(path, params=params_with_key)
+        response.raise_for_status()
+        payload = orjson.loads(response.content)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"USDA request failed: {exc}")
+    _usda_cache.set(cache_key, payload)
+    return payload
+
+
+# Macro key -> substrings of the USDA nutrient name; the first matching nutrient wins.
+_USDA_NUTRIENT_MATCHES = (
+    ("calories", ("energy",)),
+    ("protein", ("protein",)),
+    ("carbs", ("carbohydrate",)),
+    ("fats", ("total lipid", "fat")),
+)
+
+
+def _nutrient_float(nutrient: dict) -> float:
+    value = nutrient.get("value")
+    if value is None:
+        value = nutrient.get("amount")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
 
 
-def _nutrient_value(nutrients: list[dict], name_matches: list[str]) -> float:
+def _usda_macros(nutrients: list[dict]) -> dict[str, float]:
+    totals: dict[str, float] = {}
     for nutrient in nutrients:
         name = (
             nutrient.get("nutrientName")
             or nutrient.get("nutrient", {}).get("name")
             or ""
         ).lower()
-        if any(match in name for match in name_matches):
-            value = nutrient.get("value")
-            if value is None:
-                value = nutrient.get("amount")
-            try:
-                return float(value)
-            except (TypeError, ValueError):
-                return 0.0
-    return 0.0
+        for key, matches in _USDA_NUTRIENT_MATCHES:
+            if key not in totals and any(match in name for match in matches):
+                totals[key] = _nutrient_float(nutrient)
+        if len(totals) == len(_USDA_NUTRIENT_MATCHES):
+            break
+    return totals
 
 
 def _normalize_usda_food(food: dict) -> dict:
     nutrients = food.get("foodNutrients", [])
-    name = food.get("description") or food.get("description", "Food")
+    name = (food.get("description") or "Food").title()
     fdc_id = str(food.get("fdcId") or "")
-    calories = _nutrient_value(nutrients, ["energy"])
-    protein = _nutrient_value(nutrients, ["protein"])
-    carbs = _nutrient_value(nutrients, ["carbohydrate"])
-    fats = _nutrient_value(nutrients, ["total lipid", "fat"])
+    macros = _usda_macros(nutrients)
+    calories = macros.get("calories", 0.0)
+    protein = macros.get("protein", 0.0)
+    carbs = macros.get("carbs", 0.0)
+    fats = macros.get("fats", 0.0)
     serving_size = food.get("servingSize")
     serving_unit = food.get("servingSizeUnit")
     serving = None
@@ -117,7 +164,7 @@ def _normalize_usda_food(food: dict) -> dict:
 
     return {
         "source": "usda",
-        "name": name.title(),
+        "name": name,
         "serving": serving or "100 g",
         "protein": protein,
         "carbs": carbs,
@@ -135,10 +182,6 @@ def _safe_float(value) -> float:
         return 0.0
 
 
-def _fatsecret_serving_value(serving: dict, key: str) -> float:
-    return _safe_float(serving.get(key))
-
-
 def _normalize_fatsecret_search_item(food: dict) -> dict:
     return {
         "source": "fatsecret",
@@ -149,17 +192,20 @@ def _normalize_fatsecret_search_item(food: dict) -> dict:
     }
 
 
-def _parse_serving_option(serving: dict) -> dict | None:
-    """Parse a single serving option from FatSecret API."""
-    if not serving:
-        return None
-    
-    serving_id = serving.get("serving_id")
-    serving_desc = serving.get("serving_description") or ""
-    metric_amount = serving.get("metric_serving_amount")
-    metric_unit = serving.get("metric_serving_unit")
-    number_of_units = serving.get("number_of_units")
-    
+@lru_cache(maxsize=16384)
+def _serving_option_from_fields(
+    serving_id,
+    serving_desc,
+    metric_amount,
+    metric_unit,
+    number_of_units,
+    calories,
+    protein,
+    carbs,
+    fat,
+) -> dict:
+    serving_desc = serving_desc or ""
+
     # Build display text
     display_text = serving_desc
     if not display_text and metric_amount and metric_unit:
@@ -178,13 +224,43 @@ def _parse_serving_option(serving: dict) -> dict | None:
         "description": display_text or "1 serving",
         "metric_grams": metric_grams,
         "number_of_units": float(number_of_units) if number_of_units else 1.0,
-        "calories": _fatsecret_serving_value(serving, "calories"),
-        "protein": _fatsecret_serving_value(serving, "protein"),
-        "carbs": _fatsecret_serving_value(serving, "carbohydrate"),
-        "fats": _fatsecret_serving_value(serving, "fat"),
+        "calories": _safe_float(calories),
+        "protein": _safe_float(protein),
+        "carbs": _safe_float(carbs),
+        "fats": _safe_float(fat),
     }
 
 
+def _parse_serving_option(serving: dict) -> dict | None:
+    """Parse a single serving option from FatSecret API.
+
+    The same serving definitions recur across foods, so parsed options are
+    memoized on their raw fields; the returned dict is shared and read-only.
+    """
+    if not serving:
+        return None
+    
+    get = serving.get
+    fields = (
+        get("serving_id"),
+        get("serving_description"),
+        get("metric_serving_amount"),
+        get("metric_serving_unit"),
+        get("number_of_units"),
+        get("calories"),
+        get("protein"),
+        get("carbohydrate"),
+        get("fat"),
+    )
+    if fields[0]:
+        try:
+            return _serving_option_from_fields(*fields)
+        except TypeError:
+            # Unhashable field values; parse without the cache.
+            pass
+    return _serving_option_from_fields.__wrapped__(*fields)
+
+
 def _normalize_fatsecret_detail(food: dict) -> dict:
     servings_data = (food.get("servings") or {}).get("serving")
     
@@ -203,9 +279,10 @@ def _normalize_fatsecret_detail(food: dict) -> dict:
     # Use first serving for default values
     default_serving = all_servings[0] if all_servings else {}
     serving_text = default_serving.get("description", "1 serving")
+    food_id = str(food.get("food_id") or "")
 
     return {
-        "id": str(food.get("food_id") or ""),
+        "id": food_id,
         "source": "fatsecret",
         "name": (food.get("food_name") or "Food").title(),
         "serving": serving_text,
@@ -215,48 +292,59 @@ def _normalize_fatsecret_detail(food: dict) -> dict:
         "calories": default_serving.get("calories", 0),
         "serving_options": all_servings,  # All available serving sizes
         "metadata": {
-            "food_id": str(food.get("food_id") or ""),
+            "food_id": food_id,
             "brand": food.get("brand_name"),
         },
-        "food_id": str(food.get("food_id") or ""),
+        "food_id": food_id,
     }
 
 
 @router.get("/usda/search")
 async def usda_search(query: str, user_id: str | None = None):
     supabase = get_supabase()
-    payload = _usda_request("/foods/search", {"query": query, "pageSize": 20})
+    payload = await _usda_request("/foods/search", {"query": query, "pageSize": 20})
     foods = payload.get("foods", [])
     results = []
+    rows = []
     for food in foods:
         normalized = _normalize_usda_food(food)
-        row = {
-            "source": normalized["source"],
-            "name": normalized["name"],
-            "serving": normalized["serving"],
-            "protein": normalized["protein"],
-            "carbs": normalized["carbs"],
-            "fats": normalized["fats"],
-            "calories": normalized["calories"],
-            "metadata": normalized["metadata"],
-        }
+        rows.append(
+            {
+                "source": normalized["source"],
+                "name": normalized["name"],
+                "serving": normalized["serving"],
+                "protein": normalized["protein"],
+                "carbs": normalized["carbs"],
+                "fats": normalized["fats"],
+                "calories": normalized["calories"],
+                "metadata": normalized["metadata"],
+            }
+        )
+        results.append(normalized)
+    if rows:
         try:
-            supabase.table("food_items").insert(row).execute()
+            await run_query(supabase.table("food_items").insert(rows))
         except Exception:
-            pass
-        results.append(normalized)
+            # One bad row fails the whole batch; retry row by row so only that
+            # row is dropped, as before the batch insert.
+            await asyncio.gather(
+                *(run_query(supabase.table("food_items").insert(row)) for row in rows),
+                return_exceptions=True,
+            )
 
     if user_id:
-        supabase.table("search_history").insert(
-            {"user_id": user_id, "query": query, "source": "usda"}
-        ).execute()
+        await run_query(
+            supabase.table("search_history").insert(
+                {"user_id": user_id, "query": query, "source": "usda"}
+            )
+        )
     return {"query": query, "results": results}
 
 
 @router.get("/usda/food/{fdc_id}")
 async def usda_food_detail(fdc_id: str, user_id: str | None = None):
     supabase = get_supabase()
-    payload = _usda_request(f"/food/{fdc_id}", {})
+    payload = await _usda_request(f"/food/{fdc_id}", {})
     normalized = _normalize_usda_food(payload)
     row = {
         "source": normalized["source"],
@@ -269,7 +357,7 @@ async def usda_food_detail(fdc_id: str, user_id: str | None = None):
         "metadata": normalized["metadata"],
     }
     try:
-        supabase.table("food_items").insert(row).execute()
+        await run_query(supabase.table("food_items").insert(row))
     except Exception:
         pass
     return normalized
@@ -285,7 +373,7 @@ async def fatsecret_autocomplete(query: str, max_results: int = 10):
     if len(query) < 2:
         return {"suggestions": []}
     
-    payload = fatsecret_request(
+    payload = await fatsecret_request(
         "foods.autocomplete", {"expression": query, "max_results": min(max_results, 20)}
     )
     if payload.get("error"):
@@ -301,9 +389,16 @@ async def fatsecret_autocomplete(query: str, max_results: int = 10):
     return {"suggestions": suggestion_list}
 
 
+async def _fetch_fatsecret_detail(food_id: str) -> dict | None:
+    try:
+        return await fatsecret_request("food.get", {"food_id": food_id})
+    except HTTPException:
+        return None
+
+
 @router.get("/fatsecret/search")
 async def fatsecret_search(query: str, user_id: str | None = None):
-    payload = fatsecret_request(
+    payload = await fatsecret_request(
         "foods.search", {"search_expression": query, "max_results": 20, "page_number": 0}
     )
     if payload.get("error"):
@@ -311,16 +406,23 @@ async def fatsecret_search(query: str, user_id: str | None = None):
     foods = (payload.get("foods") or {}).get("food", [])
     if isinstance(foods, dict):
         foods = [foods]
+    foods = [food for food in foods if food.get("food_id")]
+    # Fetch every detail concurrently under one deadline; a lookup that fails or
+    # is still pending at the deadline falls back to the search row.
+    tasks: list[asyncio.Task] = []
+    try:
+        async with asyncio.timeout(FATSECRET_FANOUT_TIMEOUT), asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(_fetch_fatsecret_detail(str(food["food_id"])))
+                for food in foods
+            ]
+    except TimeoutError:
+        pass
     results = []
-    for food in foods:
-        food_id = str(food.get("food_id") or "")
-        if not food_id:
-            continue
-        try:
-            detail_payload = fatsecret_request("food.get", {"food_id": food_id})
-            normalized = _normalize_fatsecret_detail(detail_payload.get("food") or {})
-            results.append(normalized)
-        except HTTPException:
+    for food, task in zip(foods, tasks):
+        food_id = str(food["food_id"])
+        detail_payload = task.result() if task.done() and not task.cancelled() else None
+        if detail_payload is None:
             fallback = _normalize_fatsecret_search_item(food)
             results.append(
                 {
@@ -336,53 +438,62 @@ async def fatsecret_search(query: str, user_id: str | None = None):
                     "food_id": fallback.get("food_id") or food_id,
                 }
             )
+            continue
+        results.append(_normalize_fatsecret_detail(detail_payload.get("food") or {}))
 
     if user_id:
         supabase = get_supabase()
-        supabase.table("search_history").insert(
-            {"user_id": user_id, "query": query, "source": "fatsecret"}
-        ).execute()
+        await run_query(
+            supabase.table("search_history").insert(
+                {"user_id": user_id, "query": query, "source": "fatsecret"}
+            )
+        )
     return {"query": query, "results": results}
 
 
 def _extract_fatsecret_food_id(payload):
-    if isinstance(payload, dict):
-        if payload.get("food_id"):
-            return str(payload.get("food_id"))
-        for value in payload.values():
-            found = _extract_fatsecret_food_id(value)
-            if found:
-                return found
-    elif isinstance(payload, list):
-        for item in payload:
-            found = _extract_fatsecret_food_id(item)
-            if found:
-                return found
+    # Depth-first in document order, like the old recursive walk, without recursion.
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            food_id = node.get("food_id")
+            if food_id:
+                return str(food_id)
+            stack.extend(reversed(node.values()))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
     return None
 
 
 @router.get("/fatsecret/barcode")
 async def fatsecret_barcode(barcode: str, user_id: str | None = None):
-    payload = fatsecret_request("food.find_id_for_barcode", {"barcode": barcode})
-    if payload.get("error"):
-        raise HTTPException(status_code=502, detail=payload.get("error"))
-    food_id = _extract_fatsecret_food_id(payload)
-    if not food_id:
-        raise HTTPException(status_code=404, detail="No food found for barcode.")
-    detail_payload = fatsecret_request("food.get", {"food_id": food_id})
+    try:
+        async with asyncio.timeout(FATSECRET_FANOUT_TIMEOUT):
+            payload = await fatsecret_request("food.find_id_for_barcode", {"barcode": barcode})
+            if payload.get("error"):
+                raise HTTPException(status_code=502, detail=payload.get("error"))
+            food_id = _extract_fatsecret_food_id(payload)
+            if not food_id:
+                raise HTTPException(status_code=404, detail="No food found for barcode.")
+            detail_payload = await fatsecret_request("food.get", {"food_id": food_id})
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="FatSecret barcode lookup timed out.")
     normalized = _normalize_fatsecret_detail(detail_payload.get("food") or {})
     if user_id:
         supabase = get_supabase()
-        supabase.table("search_history").insert(
-            {"user_id": user_id, "query": barcode, "source": "fatsecret_barcode"}
-        ).execute()
+        await run_query(
+            supabase.table("search_history").insert(
+                {"user_id": user_id, "query": barcode, "source": "fatsecret_barcode"}
+            )
+        )
     return normalized
 
 
 @router.get("/fatsecret/food/{food_id}")
 async def fatsecret_food_detail(food_id: str, user_id: str | None = None):
     supabase = get_supabase()
-    payload = fatsecret_request("food.get", {"food_id": food_id})
+    payload = await fatsecret_request("food.get", {"food_id": food_id})
     food = payload.get("food") or {}
     normalized = _normalize_fatsecret_detail(food)
     row = {
@@ -396,15 +507,17 @@ async def fatsecret_food_detail(food_id: str, user_id: str | None = None):
         "metadata": normalized["metadata"],
     }
     try:
-        supabase.table("food_items").insert(row).execute()
+        await run_query(supabase.table("food_items").insert(row))
     except Exception:
         pass
     if user_id:
         normalized_user_id = _normalize_user_id(user_id)
         if normalized_user_id:
-            supabase.table("search_history").insert(
-                {"user_id": normalized_user_id, "query": normalized["name"], "source": "fatsecret_detail"}
-            ).execute()
+            await run_query(
+                supabase.table("search_history").insert(
+                    {"user_id": normalized_user_id, "query": normalized["name"], "source": "fatsecret_detail"}
+                )
+            )
     return normalized
 
 
@@ -413,22 +526,24 @@ async def log_nutrition(
     user_id: str, meal_type: str, photo_url: str | None = None, log_date: str | None = None
 ):
     supabase = get_supabase()
-    normalized_user_id = _ensure_user_record(supabase, user_id)
+    normalized_user_id = await asyncio.to_thread(_ensure_user_record, supabase, user_id)
     prompt_input = {"meal_type": meal_type, "photo_url": photo_url, "photo_urls": [photo_url] if photo_url else []}
     date_value = log_date or date.today().isoformat()
     try:
-        ai_output = run_prompt(
-            "meal_photo_parse", user_id=normalized_user_id, inputs=prompt_input
+        ai_output = await asyncio.to_thread(
+            run_prompt, "meal_photo_parse", user_id=normalized_user_id, inputs=prompt_input
+        )
+        await run_query(
+            supabase.table("nutrition_logs").insert(
+                {
+                    "user_id": normalized_user_id,
+                    "date": date_value,
+                    "meal_type": meal_type,
+                    "items": [{"raw": ai_output}],
+                    "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
+                }
+            )
         )
-        supabase.table("nutrition_logs").insert(
-            {
-                "user_id": normalized_user_id,
-                "date": date_value,
-                "meal_type": meal_type,
-                "items": [{"raw": ai_output}],
-                "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
-            }
-        ).execute()
         return {"status": "logged", "ai_result": ai_output}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -464,13 +579,11 @@ async def fetch_logs(user_id: str, log_date: str | None = None):
     normalized_user_id = _normalize_user_id(user_id)
     if not normalized_user_id:
         raise HTTPException(status_code=400, detail="Invalid user id.")
-    result = (
+    result = await run_query(
         supabase.table("nutrition_logs")
-        .select("*")
+        .select("id,date,meal_type,items,totals,created_at")
         .eq("user_id", normalized_user_id)
         .eq("date", date_value)
-        .execute()
-        .data
     )
     return {"date": date_value, "logs": result}
 
@@ -478,7 +591,7 @@ async def fetch_logs(user_id: str, log_date: str | None = None):
 @router.post("/logs/manual")
 async def log_manual_item(payload: ManualNutritionLog):
     supabase = get_supabase()
-    normalized_user_id = _ensure_user_record(supabase, payload.user_id)
+    normalized_user_id = await asyncio.to_thread(_ensure_user_record, supabase, payload.user_id)
     date_value = payload.log_date or date.today().isoformat()
     item = payload.item
     totals = {
@@ -488,26 +601,28 @@ async def log_manual_item(payload: ManualNutritionLog):
         "fats": item.fats,
     }
     try:
-        supabase.table("nutrition_logs").insert(
-            {
-                "user_id": normalized_user_id,
-                "date": date_value,
-                "meal_type": payload.meal_type,
-                "items": [
-                    {
-                        "name": item.name,
-                        "portion_value": item.portion_value,
-                        "portion_unit": item.portion_unit,
-                        "serving": item.serving,
-                        "calories": item.calories,
-                        "protein": item.protein,
-                        "carbs": item.carbs,
-                        "fats": item.fats,
-                    }
-                ],
-                "totals": totals,
-            }
-        ).execute()
+        await run_query(
+            supabase.table("nutrition_logs").insert(
+                {
+                    "user_id": normalized_user_id,
+                    "date": date_value,
+                    "meal_type": payload.meal_type,
+                    "items": [
+                        {
+                            "name": item.name,
+                            "portion_value": item.portion_value,
+                            "portion_unit": item.portion_unit,
+                            "serving": item.serving,
+                            "calories": item.calories,
+                            "protein": item.protein,
+                            "carbs": item.carbs,
+                            "fats": item.fats,
+                        }
+                    ],
+                    "totals": totals,
+                }
+            )
+        )
         return {"status": "logged", "date": date_value}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -520,9 +635,9 @@ async def add_favorite(payload: FavoriteRequest):
         normalized_user_id = _normalize_user_id(payload.user_id)
         if not normalized_user_id:
             raise HTTPException(status_code=400, detail="Invalid user id.")
-        payload_dict = payload.dict()
+        payload_dict = payload.model_dump(mode="json")
         payload_dict["user_id"] = normalized_user_id
-        supabase.table("nutrition_favorites").insert(payload_dict).execute()
+        await run_query(supabase.table("nutrition_favorites").insert(payload_dict))
         return {"status": "saved"}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
@@ -534,12 +649,10 @@ async def list_favorites(user_id: str, limit: int = 50):
     normalized_user_id = _normalize_user_id(user_id)
     if not normalized_user_id:
         raise HTTPException(status_code=400, detail="Invalid user id.")
-    result = (
+    result = await run_query(
         supabase.table("nutrition_favorites")
-        .select("*")
+        .select("id,food_item_id,created_at")
         .eq("user_id", normalized_user_id)
         .limit(limit)
-        .execute()
-        .data
     )
-    return {"user_id": user_id, "favorites": result}
+    return ORJSONResponse({"user_id": user_id, "favorites": result})
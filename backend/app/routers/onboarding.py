@@ -1,12 +1,43 @@
-from uuid import uuid4
-import hashlib
+import asyncio
+import re
+import secrets
+from typing import TypedDict
 
 from fastapi import APIRouter, HTTPException
+from postgrest.exceptions import APIError
 from pydantic import BaseModel
 
-from ..supabase_client import get_supabase
-
-router = APIRouter()
+from ..cache import profile_cache
+from ..responses import ORJSONResponse
+from ..security import hash_password
+from ..supabase_client import get_supabase, run_query
+
+router = APIRouter(default_response_class=ORJSONResponse)
+# Account fields stay out of the stored onboarding_states.data blob.
+_STATE_EXCLUDE = frozenset({"user_id", "email", "password"})
+# profiles.preferences key -> OnboardingRequest field it is copied from.
+_PREFERENCE_FIELDS = {
+    "training_level": "training_level",
+    "workout_days_per_week": "workout_days_per_week",
+    "workout_duration_minutes": "workout_duration_minutes",
+    "equipment": "equipment",
+    "weekly_weight_loss_lbs": "weekly_weight_loss_lbs",
+    "apple_health_sync": "health_kit_sync_enabled",
+    "food_allergies": "food_allergies",
+    "food_dislikes": "food_dislikes",
+    "diet_style": "diet_style",
+    "checkin_day": "checkin_day",
+    "gender": "sex",
+    "sex": "sex",
+    "activity_level": "activity_level",
+    "goal_weight_lbs": "goal_weight_lbs",
+    "birthday_timestamp": "birthday_timestamp",
+    "target_date_timestamp": "target_date_timestamp",
+    "special_considerations": "special_considerations_array",
+    "additional_notes": "additional_notes",
+    "height_unit": "height_unit",
+    "photos_pending": "photos_pending",
+}
 
 
 class OnboardingRequest(BaseModel):
@@ -44,36 +75,27 @@ class OnboardingRequest(BaseModel):
     photos_pending: bool | None = None
 
 
-class OnboardingResponse(BaseModel):
+class OnboardingResponse(TypedDict):
     user_id: str
     workout_plan: str
 
 
-def _parse_int(value: str | None) -> int | None:
-    if value is None:
-        return None
-    try:
-        return int(value)
-    except ValueError:
-        return None
+# Numeric form fields are matched up front so blank or free-text answers are
+# rejected without raising and catching a ValueError.
+_INT_RE = re.compile(r"\s*[+-]?\d+\s*")
+_FLOAT_RE = re.compile(r"\s*[+-]?(?:\d+(?:\.\d*)?|\.\d+)\s*")
 
 
-def _parse_float(value: str | None) -> float | None:
-    if value is None:
-        return None
-    try:
-        return float(value)
-    except ValueError:
+def _parse_int(value: str | None) -> int | None:
+    if value is None or not _INT_RE.fullmatch(value):
         return None
+    return int(value)
 
 
-def _parse_timestamp(value: float | None) -> float | None:
-    if value is None:
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
+def _parse_float(value: str | None) -> float | None:
+    if value is None or not _FLOAT_RE.fullmatch(value):
         return None
+    return float(value)
 
 
 def _height_cm(feet: str | None, inches: str | None) -> float | None:
@@ -100,127 +122,66 @@ def _macro_value(value: str | None) -> int | None:
     return parsed
 
 
-def _hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
-
-
-def _resolve_user_id(payload: OnboardingRequest, supabase) -> str:
-    email = (payload.email or "").strip().lower()
-    if payload.user_id:
-        existing = (
-            supabase.table("users")
-            .select("id")
-            .eq("id", payload.user_id)
-            .limit(1)
-            .execute()
-        )
-        if existing.data:
-            return payload.user_id
-    if email:
-        existing_by_email = (
-            supabase.table("users")
-            .select("id")
-            .eq("email", email)
-            .limit(1)
-            .execute()
-        )
-        if existing_by_email.data:
-            return existing_by_email.data[0]["id"]
-    if not email:
-        raise HTTPException(status_code=400, detail="Email is required.")
-
-    user_id = payload.user_id or str(uuid4())
-    password = payload.password or str(uuid4())
-    supabase.table("users").insert(
-        {
-            "id": user_id,
-            "email": email,
-            "hashed_password": _hash_password(password),
-            "role": "user",
-        }
-    ).execute()
-    return user_id
-
-
-@router.post("/", response_model=OnboardingResponse)
+@router.post("/")
 async def submit_onboarding(payload: OnboardingRequest):
     supabase = get_supabase()
-    user_id = _resolve_user_id(payload, supabase)
-
-    payload_dict = payload.dict(by_alias=True, exclude={"user_id", "email", "password"})
+    email = (payload.email or "").strip().lower()
+    # Without a password the account cannot log in anyway; store a random
+    # secret instead of spending an argon2 hash on it.
+    hashed_password = (
+        await asyncio.to_thread(hash_password, payload.password)
+        if payload.password
+        else secrets.token_hex(32)
+    )
+    payload_dict = payload.model_dump(mode="json", by_alias=True, exclude=_STATE_EXCLUDE)
 
     try:
-        existing_state = (
-            supabase.table("onboarding_states")
-            .select("id")
-            .eq("user_id", user_id)
-            .limit(1)
-            .execute()
-            .data
-        )
-        if existing_state:
-            supabase.table("onboarding_states").update(
-                {
-                    "step_index": 5,
-                    "data": payload_dict,
-                    "is_complete": True,
-                }
-            ).eq("user_id", user_id).execute()
-        else:
-            supabase.table("onboarding_states").insert(
-                {
-                    "user_id": user_id,
-                    "step_index": 5,
-                    "data": payload_dict,
-                    "is_complete": True,
-                }
-            ).execute()
-
-        macros = {
-            "calories": _macro_value(payload.macro_calories),
-            "protein": _macro_value(payload.macro_protein),
-            "carbs": _macro_value(payload.macro_carbs),
-            "fats": _macro_value(payload.macro_fats),
-        }
-        macros = {key: value for key, value in macros.items() if value is not None}
+        macros = {}
+        for key, raw in (
+            ("calories", payload.macro_calories),
+            ("protein", payload.macro_protein),
+            ("carbs", payload.macro_carbs),
+            ("fats", payload.macro_fats),
+        ):
+            value = _macro_value(raw)
+            if value is not None:
+                macros[key] = value
 
         profile_payload = {
-            "user_id": user_id,
             "full_name": payload.full_name,
             "age": _parse_int(payload.age),
             "height_cm": _height_cm(payload.height_feet, payload.height_inches),
             "weight_kg": _weight_kg(payload.weight_lbs),
             "goal": payload.goal,
+            # Reuses the validated values already dumped for the onboarding state.
             "preferences": {
-                "training_level": payload.training_level,
-                "workout_days_per_week": payload.workout_days_per_week,
-                "workout_duration_minutes": payload.workout_duration_minutes,
-                "equipment": payload.equipment,
-                "weekly_weight_loss_lbs": payload.weekly_weight_loss_lbs,
-                "apple_health_sync": payload.health_kit_sync_enabled,
-                "food_allergies": payload.food_allergies,
-                "food_dislikes": payload.food_dislikes,
-                "diet_style": payload.diet_style,
-                "checkin_day": payload.checkin_day,
-                "gender": payload.sex,
-                "sex": payload.sex,
-                "activity_level": payload.activity_level,
-                "goal_weight_lbs": payload.goal_weight_lbs,
-                "birthday_timestamp": _parse_timestamp(payload.birthday_timestamp),
-                "target_date_timestamp": _parse_timestamp(payload.target_date_timestamp),
-                "special_considerations": payload.special_considerations_array,
-                "additional_notes": payload.additional_notes,
-                "height_unit": payload.height_unit,
-                "photos_pending": payload.photos_pending,
+                key: payload_dict[field] for key, field in _PREFERENCE_FIELDS.items()
             },
         }
         if macros:
             profile_payload["macros"] = macros
 
-        supabase.table("profiles").upsert(
-            profile_payload, on_conflict="user_id"
-        ).execute()
-
-        return {"user_id": user_id, "workout_plan": ""}
+        # User resolution, onboarding state and profile in one transaction.
+        user_id = await run_query(
+            supabase.rpc(
+                "submit_onboarding",
+                {
+                    "requested_id": payload.user_id,
+                    "user_email": email,
+                    "hashed_password": hashed_password,
+                    "state_data": payload_dict,
+                    "profile": profile_payload,
+                },
+            )
+        )
+        profile_cache.pop(user_id)
+
+        # Built server-side, so no response_model re-validation pass.
+        response: OnboardingResponse = {"user_id": user_id, "workout_plan": ""}
+        return ORJSONResponse(response)
+    except APIError as exc:
+        if exc.code == "PT400":
+            raise HTTPException(status_code=400, detail=exc.message)
+        raise HTTPException(status_code=500, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
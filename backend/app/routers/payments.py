@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from ..supabase_client import get_supabase
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
 router = APIRouter()
 
@@ -23,10 +24,11 @@ class PaymentRecordRequest(BaseModel):
 async def record_payment(payload: PaymentRecordRequest):
     supabase = get_supabase()
     try:
-        result = supabase.table("payment_records").insert(payload.dict()).execute().data
+        record = payload.model_dump(mode="json")
+        result = await run_query(supabase.table("payment_records").insert(record))
         if result:
             return {"record": result[0]}
-        return {"record": payload.dict()}
+        return {"record": record}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -34,12 +36,10 @@ async def record_payment(payload: PaymentRecordRequest):
 @router.get("/user/{user_id}")
 async def list_payments(user_id: str, limit: int = 50):
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("payment_records")
         .select("*")
         .eq("user_id", user_id)
         .limit(limit)
-        .execute()
-        .data
     )
-    return {"user_id": user_id, "records": result}
+    return ORJSONResponse({"user_id": user_id, "records": result})
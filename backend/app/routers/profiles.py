@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from ..supabase_client import get_supabase
+from ..cache import profile_cache, starting_photo_cache
+from ..supabase_client import get_supabase, run_query
 
 router = APIRouter()
 
@@ -22,24 +23,26 @@ class ProfileUpsertRequest(BaseModel):
 
 @router.get("/{user_id}")
 async def get_profile(user_id: str):
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return {"profile": cached}
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("profiles")
         .select("*")
         .eq("user_id", user_id)
         .limit(1)
-        .execute()
-        .data
     )
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
+    profile_cache.set(user_id, result[0])
     return {"profile": result[0]}
 
 
 @router.put("/{user_id}")
 async def upsert_profile(user_id: str, payload: ProfileUpsertRequest):
     supabase = get_supabase()
-    update_payload = payload.dict(exclude_none=True)
+    update_payload = payload.model_dump(exclude_none=True)
     update_payload["user_id"] = user_id
     
     # Convert weight_lbs to weight_kg if provided
@@ -48,12 +51,11 @@ async def upsert_profile(user_id: str, payload: ProfileUpsertRequest):
         if weight_lbs and weight_lbs > 0:
             update_payload["weight_kg"] = weight_lbs * 0.453592
     
-    result = (
-        supabase.table("profiles")
-        .upsert(update_payload, on_conflict="user_id")
-        .execute()
-        .data
+    result = await run_query(
+        supabase.table("profiles").upsert(update_payload, on_conflict="user_id")
     )
+    profile_cache.pop(user_id)
+    starting_photo_cache.pop(user_id)
     if result:
         return {"profile": result[0]}
     return {"profile": update_payload}
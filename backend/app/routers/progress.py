@@ -1,12 +1,17 @@
+import asyncio
 from datetime import date, timedelta
 import os
 import uuid
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from postgrest import SyncFilterRequestBuilder
 
-from ..supabase_client import get_supabase
+from ..cache import starting_photo_cache
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query, upload_to_storage
 
 router = APIRouter()
+_MACRO_KEYS = ("calories", "protein", "carbs", "fats")
 
 def _to_number(value):
     try:
@@ -14,13 +19,19 @@ def _to_number(value):
     except (TypeError, ValueError):
         return 0.0
 
-def _extract_tag_value(tags, prefix: str):
+def _tag_values(tags):
+    # First "category:" and "date:" values from the tags array, in one pass.
+    category = date_value = None
     if not isinstance(tags, list):
-        return None
+        return category, date_value
     for tag in tags:
-        if isinstance(tag, str) and tag.startswith(prefix):
-            return tag[len(prefix) :]
-    return None
+        if not isinstance(tag, str):
+            continue
+        if category is None and tag.startswith("category:"):
+            category = tag[9:]
+        elif date_value is None and tag.startswith("date:"):
+            date_value = tag[5:]
+    return category, date_value
 
 def _build_tags(category: str | None, date_value: str | None):
     tags = []
@@ -43,17 +54,20 @@ def _to_bool(value, default: bool = True) -> bool:
     return default
 
 def _decorate_photo_row(row: dict):
-    tags = row.get("tags")
-    if "category" not in row:
-        row["category"] = _extract_tag_value(tags, "category:")
-    if "date" not in row:
-        row["date"] = _extract_tag_value(tags, "date:")
+    if "category" not in row or "date" not in row:
+        category, date_value = _tag_values(row.get("tags"))
+        row.setdefault("category", category)
+        row.setdefault("date", date_value)
     if "type" not in row and "photo_type" in row:
         row["type"] = row.get("photo_type")
     return row
 
+# Older postgrest builders lack .contains(); probe the builder class once.
+_SUPPORTS_CONTAINS = hasattr(SyncFilterRequestBuilder, "contains")
+
+
 def _filter_by_tag(query, tag: str):
-    if hasattr(query, "contains"):
+    if _SUPPORTS_CONTAINS:
         return query.contains("tags", [tag])
     return query.filter("tags", "cs", f"{{{tag}}}")
 
@@ -68,8 +82,7 @@ async def upload_progress_photo(
     persist_photo: bool | str = Form(True),
 ):
     supabase = get_supabase()
-    image_bytes = await photo.read()
-    if not image_bytes:
+    if not photo.size:
         raise HTTPException(status_code=400, detail="Photo is required.")
 
     bucket = os.environ.get("SUPABASE_PROGRESS_PHOTO_BUCKET", "progress-photos")
@@ -78,23 +91,23 @@ async def upload_progress_photo(
     path = f"{user_id}/{date_value}/{filename}"
 
     try:
-        supabase.storage.from_(bucket).upload(
-            path,
-            image_bytes,
-            file_options={"content-type": photo.content_type or "image/jpeg"},
-        )
+        await upload_to_storage(bucket, path, photo)
         public_url = supabase.storage.from_(bucket).get_public_url(path)
         tags = _build_tags(photo_category, date_value)
         should_persist = _to_bool(persist_photo, default=True)
         if should_persist:
-            supabase.table("progress_photos").insert(
-                {
-                    "user_id": user_id,
-                    "url": public_url,
-                    "photo_type": photo_type or "checkin",
-                    "tags": tags or None,
-                }
-            ).execute()
+            await run_query(
+                supabase.table("progress_photos").insert(
+                    {
+                        "user_id": user_id,
+                        "url": public_url,
+                        "photo_type": photo_type or "checkin",
+                        "tags": tags or None,
+                    }
+                )
+            )
+            if photo_category == "starting":
+                starting_photo_cache.pop(user_id)
         return {
             "status": "uploaded",
             "photo_url": public_url,
@@ -126,8 +139,8 @@ async def list_progress_photos(
         query = query.gte("created_at", start_date)
     if end_date:
         query = query.lte("created_at", end_date)
-    result = query.order("created_at", desc=True).limit(limit).execute().data or []
-    return {"photos": [_decorate_photo_row(dict(row)) for row in result]}
+    result = await run_query(query.order("created_at", desc=True).limit(limit)) or []
+    return ORJSONResponse({"photos": [_decorate_photo_row(row) for row in result]})
 
 
 @router.get("/macro-adherence")
@@ -139,52 +152,38 @@ async def macro_adherence(
     end_date = date.today()
     start_date = end_date - timedelta(days=max(range_days - 1, 0))
 
-    profile = (
-        supabase.table("profiles")
-        .select("macros")
-        .eq("user_id", user_id)
-        .limit(1)
-        .execute()
-        .data
+    # The target macros and the logged totals are independent reads.
+    profile, rows = await asyncio.gather(
+        run_query(
+            supabase.table("profiles")
+            .select("macros")
+            .eq("user_id", user_id)
+            .limit(1)
+        ),
+        run_query(
+            supabase.rpc(
+                "macro_adherence",
+                {
+                    "uid": user_id,
+                    "start_date": start_date.isoformat(),
+                    "end_date": end_date.isoformat(),
+                },
+            )
+        ),
     )
     macros = {}
     if profile:
         raw_macros = profile[0].get("macros") or {}
         if isinstance(raw_macros, dict):
-            macros = {
-                "calories": _to_number(raw_macros.get("calories")),
-                "protein": _to_number(raw_macros.get("protein")),
-                "carbs": _to_number(raw_macros.get("carbs")),
-                "fats": _to_number(raw_macros.get("fats")),
-            }
-
-    rows = (
-        supabase.table("nutrition_logs")
-        .select("date, totals")
-        .eq("user_id", user_id)
-        .gte("date", start_date.isoformat())
-        .lte("date", end_date.isoformat())
-        .execute()
-        .data
-    )
-
-    totals_by_date: dict[str, dict] = {}
-    for row in rows:
-        day = row.get("date")
-        totals = row.get("totals") or {}
-        if not day:
-            continue
-        existing = totals_by_date.get(day, {"calories": 0, "protein": 0, "carbs": 0, "fats": 0})
-        totals_by_date[day] = {
-            "calories": _to_number(existing.get("calories")) + _to_number(totals.get("calories")),
-            "protein": _to_number(existing.get("protein")) + _to_number(totals.get("protein")),
-            "carbs": _to_number(existing.get("carbs")) + _to_number(totals.get("carbs")),
-            "fats": _to_number(existing.get("fats")) + _to_number(totals.get("fats")),
-        }
+            macros = {key: _to_number(raw_macros.get(key)) for key in _MACRO_KEYS}
 
+    # One row per day, already summed and ordered by the database.
     days = [
-        {"date": day, "logged": totals, "target": macros}
-        for day, totals in totals_by_date.items()
+        {
+            "date": row.get("day"),
+            "logged": {key: _to_number(row.get(key)) for key in _MACRO_KEYS},
+            "target": macros,
+        }
+        for row in rows or []
     ]
-    days.sort(key=lambda item: item["date"])
-    return {"days": days}
+    return ORJSONResponse({"days": days})
@@ -1,17 +1,21 @@
+import asyncio
 from datetime import date
-import hashlib
+from functools import lru_cache
 import os
+import secrets
 import uuid
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 
 from ..prompts import run_prompt
-from ..supabase_client import get_supabase
+from ..supabase_client import get_supabase, run_query, upload_to_storage
 
 router = APIRouter()
 
 
+# Pure function of the id string; memoized since it runs on most requests.
+@lru_cache(maxsize=4096)
 def _normalize_user_id(user_id: str | None) -> str | None:
     if not user_id:
         return None
@@ -25,21 +29,19 @@ def _ensure_user_record(supabase, user_id: str | None) -> str | None:
     normalized = _normalize_user_id(user_id)
     if not normalized:
         return None
-    existing = (
-        supabase.table("users").select("id").eq("id", normalized).limit(1).execute().data
-    )
-    if existing:
-        return normalized
-
+    # Insert-if-missing in one request; an existing user row is left untouched.
     email = f"user-{normalized}@fitai.local"
-    hashed_password = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
-    supabase.table("users").insert(
+    # Placeholder accounts never log in; a random secret, not a hash of the id.
+    hashed_password = secrets.token_hex(32)
+    supabase.table("users").upsert(
         {
             "id": normalized,
             "email": email,
             "hashed_password": hashed_password,
             "role": "user",
-        }
+        },
+        on_conflict="id",
+        ignore_duplicates=True,
     ).execute()
     return normalized
 
@@ -51,35 +53,33 @@ async def scan_meal_photo(
     photo: UploadFile = File(...),
 ):
     supabase = get_supabase()
-    normalized_user_id = _ensure_user_record(supabase, user_id)
-    image_bytes = await photo.read()
-    if not image_bytes:
+    normalized_user_id = await asyncio.to_thread(_ensure_user_record, supabase, user_id)
+    if not photo.size:
         raise HTTPException(status_code=400, detail="Photo is required.")
 
     bucket = os.environ.get("SUPABASE_MEAL_PHOTO_BUCKET", "meal-photos")
     filename = f"{uuid.uuid4().hex}.jpg"
-    path = f"{normalized_user_id}/{date.today().isoformat()}/{filename}"
+    today_iso = date.today().isoformat()
+    path = f"{normalized_user_id}/{today_iso}/{filename}"
 
     try:
-        supabase.storage.from_(bucket).upload(
-            path,
-            image_bytes,
-            file_options={"content-type": photo.content_type or "image/jpeg"},
-        )
+        await upload_to_storage(bucket, path, photo)
         public_url = supabase.storage.from_(bucket).get_public_url(path)
         prompt_input = {"meal_type": meal_type, "photo_url": public_url, "photo_urls": [public_url]}
-        ai_output = run_prompt(
-            "meal_photo_parse", user_id=normalized_user_id, inputs=prompt_input
+        ai_output = await asyncio.to_thread(
+            run_prompt, "meal_photo_parse", user_id=normalized_user_id, inputs=prompt_input
+        )
+        await run_query(
+            supabase.table("nutrition_logs").insert(
+                {
+                    "user_id": normalized_user_id,
+                    "date": today_iso,
+                    "meal_type": meal_type,
+                    "items": [{"raw": ai_output, "photo_url": public_url}],
+                    "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
+                }
+            )
         )
-        supabase.table("nutrition_logs").insert(
-            {
-                "user_id": normalized_user_id,
-                "date": date.today().isoformat(),
-                "meal_type": meal_type,
-                "items": [{"raw": ai_output, "photo_url": public_url}],
-                "totals": {"calories": 0, "protein": 0, "carbs": 0, "fats": 0},
-            }
-        ).execute()
         return {"status": "logged", "ai_result": ai_output, "photo_url": public_url}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
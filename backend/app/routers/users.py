@@ -1,11 +1,14 @@
-from datetime import datetime
-import json
+import asyncio
+from datetime import datetime, timezone
 
+import orjson
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from ..cache import profile_cache
 from ..prompts import run_prompt
-from ..supabase_client import get_supabase
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
 router = APIRouter()
 
@@ -37,8 +40,8 @@ def _parse_macro_value(value: str | int | float | None) -> int | None:
 
 def _normalize_ai_macros(raw_output: str) -> dict | None:
     try:
-        parsed = json.loads(raw_output)
-    except json.JSONDecodeError:
+        parsed = orjson.loads(raw_output)
+    except orjson.JSONDecodeError:
         return None
 
     if isinstance(parsed, dict) and "macros" in parsed and isinstance(parsed["macros"], dict):
@@ -82,17 +85,19 @@ def _has_required_macro_inputs(inputs: dict) -> bool:
 
 @router.get("/me")
 async def get_user_profile(user_id: str):
+    cached = profile_cache.get(user_id)
+    if cached is not None:
+        return {"profile": cached}
     supabase = get_supabase()
-    result = (
+    result = await run_query(
         supabase.table("profiles")
         .select("*")
         .eq("user_id", user_id)
         .limit(1)
-        .execute()
-        .data
     )
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
+    profile_cache.set(user_id, result[0])
     return {"profile": result[0]}
 
 
@@ -102,17 +107,16 @@ async def complete_tutorial(payload: TutorialCompleteRequest):
     update_payload = {
         "user_id": payload.user_id,
         "tutorial_completed": payload.completed,
-        "tutorial_completed_at": datetime.utcnow().isoformat()
+        "tutorial_completed_at": datetime.now(timezone.utc).isoformat()
         if payload.completed
         else None,
     }
     try:
-        result = (
+        result = await run_query(
             supabase.table("profiles")
             .upsert(update_payload, on_conflict="user_id")
-            .execute()
-            .data
         )
+        profile_cache.pop(payload.user_id)
         if result:
             return {"profile": result[0]}
         return {"profile": update_payload}
@@ -128,12 +132,11 @@ async def update_checkin_day(payload: CheckInDayRequest):
         "check_in_day": payload.check_in_day,
     }
     try:
-        result = (
+        result = await run_query(
             supabase.table("profiles")
             .upsert(update_payload, on_conflict="user_id")
-            .execute()
-            .data
         )
+        profile_cache.pop(payload.user_id)
         if result:
             return {"profile": result[0]}
         return {"profile": update_payload}
@@ -144,13 +147,11 @@ async def update_checkin_day(payload: CheckInDayRequest):
 @router.post("/macros/generate")
 async def generate_macros(payload: GenerateMacrosRequest):
     supabase = get_supabase()
-    profile = (
+    profile = await run_query(
         supabase.table("profiles")
         .select("*")
         .eq("user_id", payload.user_id)
         .limit(1)
-        .execute()
-        .data
     )
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -161,24 +162,25 @@ async def generate_macros(payload: GenerateMacrosRequest):
         raise HTTPException(status_code=400, detail="Profile data incomplete for macro generation")
 
     try:
-        ai_output = run_prompt("macro_generation", user_id=payload.user_id, inputs=macro_inputs)
+        ai_output = await asyncio.to_thread(
+            run_prompt, "macro_generation", user_id=payload.user_id, inputs=macro_inputs
+        )
         ai_macros = _normalize_ai_macros(ai_output)
         if not ai_macros:
             raise HTTPException(status_code=502, detail="AI macro output invalid")
         update_payload = {
             "user_id": payload.user_id,
             "macros": ai_macros,
-            "updated_at": datetime.utcnow().isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
         }
-        result = (
+        result = await run_query(
             supabase.table("profiles")
             .upsert(update_payload, on_conflict="user_id")
-            .execute()
-            .data
         )
+        profile_cache.pop(payload.user_id)
         if result:
-            return {"macros": result[0].get("macros", ai_macros)}
-        return {"macros": ai_macros}
+            return ORJSONResponse({"macros": result[0].get("macros", ai_macros)})
+        return ORJSONResponse({"macros": ai_macros})
     except HTTPException:
         raise
     except Exception as exc:
@@ -1,14 +1,23 @@
-from datetime import datetime
+import asyncio
+from collections.abc import AsyncIterator
+from functools import lru_cache
+import os
+import re
 import uuid
 
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool
 from supabase import Client
 
-from ..prompts import run_prompt
-from ..supabase_client import get_supabase
+from ..cache import TTLCache, exercise_history_cache, template_detail_cache, template_list_cache
+from ..prompts import run_prompt, stream_prompt
+from ..responses import ORJSONResponse
+from ..supabase_client import get_supabase, run_query
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class GenerateWorkoutRequest(BaseModel):
@@ -17,6 +26,7 @@ class GenerateWorkoutRequest(BaseModel):
     workout_type: str | None = None
     equipment: list[str] | None = None
     duration_minutes: int | None = None
+    stream: bool = False
 
 
 class ExerciseInput(BaseModel):
@@ -72,53 +82,73 @@ class CompleteSessionRequest(BaseModel):
     status: str = "completed"
 
 
-def _get_or_create_exercise(supabase: Client, exercise: ExerciseInput) -> str:
-    existing = (
-        supabase.table("exercises")
-        .select("id")
-        .eq("name", exercise.name)
-        .limit(1)
-        .execute()
-        .data
-    )
-    if existing:
-        return existing[0]["id"]
-
-    created = (
-        supabase.table("exercises")
-        .insert(
-            {
-                "name": exercise.name,
-                "muscle_groups": exercise.muscle_groups,
-                "equipment": exercise.equipment,
-            }
-        )
-        .execute()
-        .data
-    )
-    if not created:
-        raise HTTPException(status_code=500, detail="Failed to create exercise")
-    return created[0]["id"]
-
-
 def _estimate_one_rep_max(weight: float, reps: int) -> float:
     if weight <= 0 or reps <= 0:
         return 0
     return round(weight * (1 + reps / 30), 2)
 
 
+# Postgres ("column x of relation y does not exist") and PostgREST schema
+# cache ("Could not find the 'x' column of 'y'") wordings of the same errors.
+_MISSING_COLUMN_RE = re.compile(
+    r'column\s+"?(?:\w+\.)?(\w+)"?(?:\s+of relation\s+"?[\w.]+"?)?\s+does not exist'
+    r"|could not find the '(\w+)' column",
+    re.IGNORECASE,
+)
+_MISSING_TABLE_RE = re.compile(
+    r'relation\s+"?(?:\w+\.)?(\w+)"?\s+does not exist'
+    r"|could not find the table '(?:\w+\.)?(\w+)'",
+    re.IGNORECASE,
+)
+
+
+def _names_in_error(pattern: re.Pattern, exc: Exception) -> set[str]:
+    return {
+        (match.group(1) or match.group(2)).lower()
+        for match in pattern.finditer(str(exc))
+    }
+
+
 def _is_missing_column_error(exc: Exception, column_name: str) -> bool:
-    message = str(exc).lower()
-    col = column_name.lower()
-    return col in message and "column" in message and "does not exist" in message
+    return column_name.lower() in _names_in_error(_MISSING_COLUMN_RE, exc)
 
 
 def _is_missing_table_error(exc: Exception, table_name: str) -> bool:
-    message = str(exc).lower()
-    table = table_name.lower()
-    return table in message and ("does not exist" in message or "relation" in message)
+    return table_name.lower() in _names_in_error(_MISSING_TABLE_RE, exc)
+
+
+# Optional columns/tables found missing on this database. The schema does not
+# change under a running process, so each gap costs one failed request and
+# later requests build a payload the schema accepts up front.
+_missing_columns: set[tuple[str, str]] = set()
+_missing_tables: set[str] = set()
 
 
+async def _insert_dropping_missing(
+    supabase: Client, table: str, payload: dict, optional_columns: tuple[str, ...]
+):
+    while True:
+        row = {
+            key: value for key, value in payload.items() if (table, key) not in _missing_columns
+        }
+        try:
+            return await run_query(supabase.table(table).insert(row))
+        except Exception as exc:
+            missing = next(
+                (
+                    column
+                    for column in optional_columns
+                    if column in row and _is_missing_column_error(exc, column)
+                ),
+                None,
+            )
+            if missing is None:
+                raise
+            _missing_columns.add((table, missing))
+
+
+# Pure function of the id string; memoized since it runs on most requests.
+@lru_cache(maxsize=4096)
 def _normalize_user_id(user_id: str | None) -> str | None:
     if not user_id:
         return None
@@ -128,45 +158,135 @@ def _normalize_user_id(user_id: str | None) -> str | None:
         return str(uuid.uuid5(uuid.NAMESPACE_URL, f"fitai:{user_id}"))
 
 
+# user_ids already confirmed to have a users row in this process.
+_known_users = TTLCache(maxsize=10_000, ttl=600)
+
+
 def _ensure_user_exists(supabase: Client, user_id: str | None) -> str | None:
     if not user_id:
         return None
-    existing = (
-        supabase.table("users")
-        .select("id")
-        .eq("id", user_id)
-        .limit(1)
-        .execute()
-        .data
-    )
-    if existing:
+    if _known_users.get(user_id):
         return user_id
+    # Insert-if-missing in one request; an existing user row is left untouched.
     placeholder_email = f"user-{user_id}@placeholder.local"
-    supabase.table("users").insert(
+    supabase.table("users").upsert(
         {
             "id": user_id,
             "email": placeholder_email,
             "hashed_password": "placeholder",
             "role": "user",
-        }
+        },
+        on_conflict="id",
+        ignore_duplicates=True,
     ).execute()
+    _known_users.set(user_id, True)
     return user_id
 
 
+# workout_generation results keyed on the normalized generation inputs. The
+# prompt output does not depend on the user, so equivalent requests share it.
+_generated_workouts = TTLCache(maxsize=10_000, ttl=3600)
+_generation_inflight: dict[tuple, asyncio.Task] = {}
+
+_TERM_SEPARATOR_RE = re.compile(r"[\s_-]+")
+
+
+def _normalize_term(value: str) -> str:
+    # "Pull-up bar", "pull_up bar" and " PULL UP BAR" describe the same input;
+    # fold case and separators so they share a cache key.
+    return _TERM_SEPARATOR_RE.sub(" ", value.strip().lower())
+
+
+def _normalize_terms(values: list[str] | None) -> tuple[str, ...]:
+    return tuple(sorted({_normalize_term(value) for value in values or [] if value.strip()}))
+
+
+def _generation_key(payload: GenerateWorkoutRequest) -> tuple:
+    return (
+        _normalize_terms(payload.muscle_groups),
+        _normalize_term(payload.workout_type or ""),
+        _normalize_terms(payload.equipment),
+        payload.duration_minutes,
+    )
+
+
+@lru_cache(maxsize=1)
+def _get_generation_semaphore() -> asyncio.Semaphore:
+    # Caps concurrent workout_generation calls so a burst of requests stays
+    # under the provider's rate limit instead of all hitting it at once.
+    return asyncio.Semaphore(int(os.environ.get("WORKOUT_GENERATION_CONCURRENCY", "8")))
+
+
+async def _generate_and_cache(cache_key: tuple, user_id: str | None, prompt_input: dict) -> str:
+    async with _get_generation_semaphore():
+        result = await asyncio.to_thread(
+            run_prompt, "workout_generation", user_id=user_id, inputs=prompt_input
+        )
+    _generated_workouts.set(cache_key, result)
+    return result
+
+
+def _sse_event(payload: dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def _stream_generated_workout(
+    cache_key: tuple, cached: str | None, user_id: str | None, prompt_input: dict
+) -> AsyncIterator[bytes]:
+    # Sends {"delta": ...} events while the model writes, then the full
+    # {"template": ...} and [DONE]. A matching non-streamed generation already
+    # in flight is awaited instead, and new streams hold the same concurrency
+    # slot as non-streamed calls.
+    try:
+        if cached is None and cache_key in _generation_inflight:
+            cached = await asyncio.shield(_generation_inflight[cache_key])
+        if cached is None:
+            chunks: list[str] = []
+            async with _get_generation_semaphore():
+                async for delta in iterate_in_threadpool(
+                    stream_prompt("workout_generation", user_id=user_id, inputs=prompt_input)
+                ):
+                    chunks.append(delta)
+                    yield _sse_event({"delta": delta})
+            cached = "".join(chunks)
+            _generated_workouts.set(cache_key, cached)
+    except Exception as exc:
+        yield _sse_event({"error": str(exc)})
+        return
+    yield _sse_event({"template": cached})
+    yield b"data: [DONE]\n\n"
+
+
 @router.post("/generate")
 async def generate_workout(payload: GenerateWorkoutRequest):
     supabase: Client = get_supabase()
-    user_id = _ensure_user_exists(supabase, _normalize_user_id(payload.user_id))
+    user_id = await asyncio.to_thread(
+        _ensure_user_exists, supabase, _normalize_user_id(payload.user_id)
+    )
+    cache_key = _generation_key(payload)
+    cached = _generated_workouts.get(cache_key)
     prompt_input = {
         "muscle_groups": payload.muscle_groups,
         "workout_type": payload.workout_type,
         "equipment": payload.equipment,
         "duration_minutes": payload.duration_minutes,
     }
-    try:
-        result = run_prompt(
-            "workout_generation", user_id=user_id, inputs=prompt_input
+    if payload.stream:
+        return StreamingResponse(
+            _stream_generated_workout(cache_key, cached, user_id, prompt_input),
+            media_type="text/event-stream",
         )
+    if cached is not None:
+        return {"template": cached}
+    # Identical requests already generating share that call's result.
+    task = _generation_inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_generate_and_cache(cache_key, user_id, prompt_input))
+        _generation_inflight[cache_key] = task
+        task.add_done_callback(lambda _: _generation_inflight.pop(cache_key, None))
+    try:
+        # Shielded so one caller disconnecting does not cancel the shared call.
+        result = await asyncio.shield(task)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -176,43 +296,34 @@ async def generate_workout(payload: GenerateWorkoutRequest):
 @router.post("/templates")
 async def create_template(payload: SaveTemplateRequest):
     supabase: Client = get_supabase()
-    user_id = _ensure_user_exists(supabase, _normalize_user_id(payload.user_id))
+    user_id = await asyncio.to_thread(
+        _ensure_user_exists, supabase, _normalize_user_id(payload.user_id)
+    )
     try:
-        template_rows = (
-            supabase.table("workout_templates")
-            .insert(
+        # The template, new catalog exercises and link rows are written in one
+        # transaction, so a failure cannot leave a template without exercises.
+        template_id = await run_query(
+            supabase.rpc(
+                "create_workout_template",
                 {
-                    "user_id": user_id,
-                    "title": payload.title,
-                    "description": payload.description,
-                    "mode": payload.mode,
-                }
+                    "uid": user_id,
+                    "template_title": payload.title,
+                    "template_description": payload.description,
+                    "template_mode": payload.mode,
+                    "template_exercises": [
+                        exercise.model_dump(mode="json") for exercise in payload.exercises
+                    ],
+                },
             )
-            .execute()
-            .data
         )
-        if not template_rows:
+        if not template_id:
             raise HTTPException(status_code=500, detail="Failed to create template")
-        template_id = template_rows[0]["id"]
-
-        for idx, exercise in enumerate(payload.exercises):
-            exercise_id = _get_or_create_exercise(supabase, exercise)
-            supabase.table("workout_template_exercises").insert(
-                {
-                    "template_id": template_id,
-                    "exercise_id": exercise_id,
-                    "position": idx,
-                    "sets": exercise.sets or 0,
-                    "reps": exercise.reps or 0,
-                    "rest_seconds": exercise.rest_seconds or 0,
-                    "notes": exercise.notes,
-                }
-            ).execute()
     except HTTPException:
         raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
+    template_list_cache.pop(user_id)
     return {"template_id": template_id}
 
 
@@ -220,76 +331,79 @@ async def create_template(payload: SaveTemplateRequest):
 async def list_templates(user_id: str):
     supabase: Client = get_supabase()
     normalized_user_id = _normalize_user_id(user_id)
+    cached = template_list_cache.get(normalized_user_id)
+    if cached is not None:
+        return ORJSONResponse({"templates": cached})
     try:
-        templates = (
+        templates = await run_query(
             supabase.table("workout_templates")
             .select("id,title,description,mode,created_at")
             .eq("user_id", normalized_user_id)
             .order("created_at", desc=True)
-            .execute()
-            .data
         )
-        return {"templates": templates or []}
+        templates = templates or []
+        template_list_cache.set(normalized_user_id, templates)
+        return ORJSONResponse({"templates": templates})
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
 
+# Shared fallbacks for template exercises whose exercise row or arrays are
+# missing; serialized as {} and [] and never mutated.
+_NO_EXERCISE: dict = {}
+_EMPTY = ()
+
+
 @router.get("/templates/{template_id}")
 async def get_template_detail(template_id: str):
+    cached = template_detail_cache.get(template_id)
+    if cached is not None:
+        return ORJSONResponse(cached)
     supabase: Client = get_supabase()
     try:
-        template_rows = (
-            supabase.table("workout_templates")
-            .select("id,title,description,mode,created_at")
-            .eq("id", template_id)
-            .limit(1)
-            .execute()
-            .data
+        # The template row and its exercise links are both keyed by template_id;
+        # each link embeds its exercise through the exercise_id foreign key.
+        template_rows, template_exercises = await asyncio.gather(
+            run_query(
+                supabase.table("workout_templates")
+                .select("id,title,description,mode,created_at")
+                .eq("id", template_id)
+                .limit(1)
+            ),
+            run_query(
+                supabase.table("workout_template_exercises")
+                .select(
+                    "exercise_id,position,sets,reps,rest_seconds,notes,"
+                    "exercises(name,muscle_groups,equipment)"
+                )
+                .eq("template_id", template_id)
+                .order("position")
+            ),
         )
         if not template_rows:
             raise HTTPException(status_code=404, detail="Template not found")
         template = template_rows[0]
 
-        template_exercises = (
-            supabase.table("workout_template_exercises")
-            .select(
-                "exercise_id,position,sets,reps,rest_seconds,notes"
-            )
-            .eq("template_id", template_id)
-            .order("position")
-            .execute()
-            .data
-        )
-
-        exercise_ids = [row["exercise_id"] for row in template_exercises if row.get("exercise_id")]
-        exercise_map: dict[str, dict] = {}
-        if exercise_ids:
-            exercises = (
-                supabase.table("exercises")
-                .select("id,name,muscle_groups,equipment")
-                .in_("id", exercise_ids)
-                .execute()
-                .data
-            )
-            exercise_map = {row["id"]: row for row in exercises or []}
-
         enriched = []
+        append = enriched.append
         for row in template_exercises or []:
-            exercise = exercise_map.get(row.get("exercise_id"), {})
-            enriched.append(
+            exercise = row["exercises"] or _NO_EXERCISE
+            append(
                 {
-                    "exercise_id": row.get("exercise_id"),
+                    "exercise_id": row["exercise_id"],
                     "name": exercise.get("name", "Unknown"),
-                    "muscle_groups": exercise.get("muscle_groups") or [],
-                    "equipment": exercise.get("equipment") or [],
-                    "sets": row.get("sets"),
-                    "reps": row.get("reps"),
-                    "rest_seconds": row.get("rest_seconds"),
-                    "notes": row.get("notes"),
-                    "position": row.get("position"),
+                    "muscle_groups": exercise.get("muscle_groups") or _EMPTY,
+                    "equipment": exercise.get("equipment") or _EMPTY,
+                    "sets": row["sets"],
+                    "reps": row["reps"],
+                    "rest_seconds": row["rest_seconds"],
+                    "notes": row["notes"],
+                    "position": row["position"],
                 }
             )
-        return {"template": template, "exercises": enriched}
+        response = {"template": template, "exercises": enriched}
+        template_detail_cache.set(template_id, response)
+        return ORJSONResponse(response)
     except HTTPException:
         raise
     except Exception as exc:
@@ -300,39 +414,24 @@ async def get_template_detail(template_id: str):
 async def update_template(template_id: str, payload: UpdateTemplateRequest):
     supabase: Client = get_supabase()
     try:
-        updated = (
-            supabase.table("workout_templates")
-            .update(
+        updated = await run_query(
+            supabase.rpc(
+                "update_workout_template",
                 {
-                    "title": payload.title,
-                    "description": payload.description,
-                    "mode": payload.mode,
-                }
+                    "target_template": template_id,
+                    "template_title": payload.title,
+                    "template_description": payload.description,
+                    "template_mode": payload.mode,
+                    "template_exercises": [
+                        exercise.model_dump(mode="json") for exercise in payload.exercises
+                    ],
+                },
             )
-            .eq("id", template_id)
-            .execute()
-            .data
         )
         if not updated:
             raise HTTPException(status_code=404, detail="Template not found")
-
-        supabase.table("workout_template_exercises").delete().eq(
-            "template_id", template_id
-        ).execute()
-
-        for idx, exercise in enumerate(payload.exercises):
-            exercise_id = _get_or_create_exercise(supabase, exercise)
-            supabase.table("workout_template_exercises").insert(
-                {
-                    "template_id": template_id,
-                    "exercise_id": exercise_id,
-                    "position": idx,
-                    "sets": exercise.sets or 0,
-                    "reps": exercise.reps or 0,
-                    "rest_seconds": exercise.rest_seconds or 0,
-                    "notes": exercise.notes,
-                }
-            ).execute()
+        template_detail_cache.pop(template_id)
+        template_list_cache.pop(updated[0].get("user_id"))
         return {"template_id": template_id}
     except HTTPException:
         raise
@@ -344,15 +443,15 @@ async def update_template(template_id: str, payload: UpdateTemplateRequest):
 async def delete_template(template_id: str):
     supabase: Client = get_supabase()
     try:
-        deleted = (
+        deleted = await run_query(
             supabase.table("workout_templates")
             .delete()
             .eq("id", template_id)
-            .execute()
-            .data
         )
         if not deleted:
             raise HTTPException(status_code=404, detail="Template not found")
+        template_detail_cache.pop(template_id)
+        template_list_cache.pop(deleted[0].get("user_id"))
         return {"template_id": template_id}
     except HTTPException:
         raise
@@ -364,16 +463,14 @@ async def delete_template(template_id: str):
 async def duplicate_template(template_id: str, payload: DuplicateTemplateRequest):
     supabase: Client = get_supabase()
     try:
-        normalized_user_id = _ensure_user_exists(
-            supabase, _normalize_user_id(payload.user_id)
+        normalized_user_id = await asyncio.to_thread(
+            _ensure_user_exists, supabase, _normalize_user_id(payload.user_id)
         )
-        template_rows = (
+        template_rows = await run_query(
             supabase.table("workout_templates")
             .select("id,user_id,title,description,mode")
             .eq("id", template_id)
             .limit(1)
-            .execute()
-            .data
         )
         if not template_rows:
             raise HTTPException(status_code=404, detail="Template not found")
@@ -381,7 +478,7 @@ async def duplicate_template(template_id: str, payload: DuplicateTemplateRequest
 
         new_title = payload.title or f"{template['title']} Copy"
         new_user_id = normalized_user_id or template.get("user_id")
-        new_rows = (
+        new_rows = await run_query(
             supabase.table("workout_templates")
             .insert(
                 {
@@ -391,33 +488,32 @@ async def duplicate_template(template_id: str, payload: DuplicateTemplateRequest
                     "mode": template.get("mode"),
                 }
             )
-            .execute()
-            .data
         )
         if not new_rows:
             raise HTTPException(status_code=500, detail="Failed to duplicate template")
         new_template_id = new_rows[0]["id"]
+        template_list_cache.pop(new_user_id)
 
-        template_exercises = (
+        template_exercises = await run_query(
             supabase.table("workout_template_exercises")
             .select("exercise_id,position,sets,reps,rest_seconds,notes")
             .eq("template_id", template_id)
             .order("position")
-            .execute()
-            .data
         )
-        for row in template_exercises or []:
-            supabase.table("workout_template_exercises").insert(
-                {
-                    "template_id": new_template_id,
-                    "exercise_id": row.get("exercise_id"),
-                    "position": row.get("position", 0),
-                    "sets": row.get("sets", 0),
-                    "reps": row.get("reps", 0),
-                    "rest_seconds": row.get("rest_seconds", 0),
-                    "notes": row.get("notes"),
-                }
-            ).execute()
+        copied_rows = [
+            {
+                "template_id": new_template_id,
+                "exercise_id": row.get("exercise_id"),
+                "position": row.get("position", 0),
+                "sets": row.get("sets", 0),
+                "reps": row.get("reps", 0),
+                "rest_seconds": row.get("rest_seconds", 0),
+                "notes": row.get("notes"),
+            }
+            for row in template_exercises or []
+        ]
+        if copied_rows:
+            await run_query(supabase.table("workout_template_exercises").insert(copied_rows))
         return {"template_id": new_template_id}
     except HTTPException:
         raise
@@ -430,31 +526,20 @@ async def list_sessions(user_id: str):
     supabase: Client = get_supabase()
     normalized_user_id = _normalize_user_id(user_id)
     try:
-        sessions = (
+        # Template titles come back embedded through the template_id foreign key.
+        sessions = await run_query(
             supabase.table("workout_sessions")
-            .select("id,template_id,status,duration_seconds,created_at")
+            .select("id,template_id,status,duration_seconds,created_at,workout_templates(title)")
             .eq("user_id", normalized_user_id)
             .order("created_at", desc=True)
             .limit(20)
-            .execute()
-            .data
         )
-        template_ids = [row["template_id"] for row in sessions or [] if row.get("template_id")]
-        template_titles = {}
-        if template_ids:
-            templates = (
-                supabase.table("workout_templates")
-                .select("id,title")
-                .in_("id", template_ids)
-                .execute()
-                .data
-            )
-            template_titles = {row["id"]: row["title"] for row in templates or []}
         enriched = []
         for session in sessions or []:
-            session["template_title"] = template_titles.get(session.get("template_id"))
+            template = session.pop("workout_templates", None) or {}
+            session["template_title"] = template.get("title")
             enriched.append(session)
-        return {"sessions": enriched}
+        return ORJSONResponse({"sessions": enriched})
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -462,20 +547,19 @@ async def list_sessions(user_id: str):
 @router.post("/sessions/start")
 async def start_session(payload: StartSessionRequest):
     supabase: Client = get_supabase()
-    user_id = _ensure_user_exists(supabase, _normalize_user_id(payload.user_id))
+    user_id = await asyncio.to_thread(
+        _ensure_user_exists, supabase, _normalize_user_id(payload.user_id)
+    )
     try:
-        rows = (
+        rows = await run_query(
             supabase.table("workout_sessions")
             .insert(
                 {
                     "user_id": user_id,
                     "template_id": payload.template_id,
                     "status": payload.status,
-                    "started_at": datetime.utcnow().isoformat(),
                 }
             )
-            .execute()
-            .data
         )
         if not rows:
             raise HTTPException(status_code=500, detail="Failed to start session")
@@ -507,21 +591,29 @@ async def log_exercise(session_id: str, payload: SessionLogRequest):
             "duration_minutes": duration_minutes if has_duration else 0,
             "notes": payload.notes,
         }
-        try:
-            rows = supabase.table("exercise_logs").insert(insert_payload).execute().data
-        except Exception as exc:
-            if not _is_missing_column_error(exc, "duration_minutes"):
-                raise
+        legacy_logs = ("exercise_logs", "duration_minutes") in _missing_columns
+        if not legacy_logs:
+            try:
+                rows = await run_query(supabase.table("exercise_logs").insert(insert_payload))
+            except Exception as exc:
+                if not _is_missing_column_error(exc, "duration_minutes"):
+                    raise
+                _missing_columns.add(("exercise_logs", "duration_minutes"))
+                legacy_logs = True
+        if legacy_logs:
             # Back-compat: older schemas may not have `duration_minutes`.
             # Store cardio duration in `reps` so the client can still render minutes.
             fallback = dict(insert_payload)
             fallback.pop("duration_minutes", None)
             if has_duration:
                 fallback["reps"] = duration_minutes
-            rows = supabase.table("exercise_logs").insert(fallback).execute().data
+            rows = await run_query(supabase.table("exercise_logs").insert(fallback))
         if not rows:
             raise HTTPException(status_code=500, detail="Failed to log exercise")
         log_id = rows[0]["id"]
+        # The log row carries no user_id, so drop this exercise's history for
+        # every user rather than look the session owner up.
+        exercise_history_cache.pop_where(lambda key: key[1] == payload.exercise_name)
 
         set_payload = {
             "exercise_log_id": log_id,
@@ -531,25 +623,18 @@ async def log_exercise(session_id: str, payload: SessionLogRequest):
             "weight": 0 if has_duration else payload.weight,
             "duration_seconds": duration_seconds,
         }
-        try:
-            supabase.table("exercise_sets").insert(set_payload).execute()
-        except Exception as exc:
-            if _is_missing_table_error(exc, "exercise_sets"):
-                pass
-            elif _is_missing_column_error(exc, "duration_seconds"):
-                fallback = dict(set_payload)
-                fallback.pop("duration_seconds", None)
-                supabase.table("exercise_sets").insert(fallback).execute()
-            elif _is_missing_column_error(exc, "is_warmup"):
-                fallback = dict(set_payload)
-                fallback.pop("is_warmup", None)
-                supabase.table("exercise_sets").insert(fallback).execute()
-            elif _is_missing_column_error(exc, "set_index"):
-                fallback = dict(set_payload)
-                fallback.pop("set_index", None)
-                supabase.table("exercise_sets").insert(fallback).execute()
-            else:
-                raise
+        if "exercise_sets" not in _missing_tables:
+            try:
+                await _insert_dropping_missing(
+                    supabase,
+                    "exercise_sets",
+                    set_payload,
+                    ("duration_seconds", "is_warmup", "set_index"),
+                )
+            except Exception as exc:
+                if not _is_missing_table_error(exc, "exercise_sets"):
+                    raise
+                _missing_tables.add("exercise_sets")
         return {"log_id": rows[0]["id"]}
     except HTTPException:
         raise
@@ -561,80 +646,44 @@ async def log_exercise(session_id: str, payload: SessionLogRequest):
 async def complete_session(session_id: str, payload: CompleteSessionRequest):
     supabase: Client = get_supabase()
     try:
-        sessions = (
+        sessions = await run_query(
             supabase.table("workout_sessions")
             .select("id,user_id")
             .eq("id", session_id)
             .limit(1)
-            .execute()
-            .data
         )
         if not sessions:
             raise HTTPException(status_code=404, detail="Session not found")
         session = sessions[0]
 
-        supabase.table("workout_sessions").update(
+        # Marking the session complete and recording its PRs are independent;
+        # the PR comparison and insert happen in the database.
+        _, new_prs = await asyncio.gather(
+            run_query(
+                supabase.table("workout_sessions")
+                .update(
+                    {
+                        "status": payload.status,
+                        "duration_seconds": payload.duration_seconds or 0,
+                    }
+                )
+                .eq("id", session_id)
+            ),
+            run_query(supabase.rpc("record_session_prs", {"target_session": session_id})),
+        )
+        pr_updates = [
             {
-                "status": payload.status,
-                "duration_seconds": payload.duration_seconds or 0,
-                "completed_at": datetime.utcnow().isoformat(),
+                "exercise_name": row.get("exercise_name"),
+                "value": float(row.get("value") or 0),
+                "previous_value": (
+                    float(row["previous_value"]) if row.get("previous_value") is not None else None
+                ),
             }
-        ).eq("id", session_id).execute()
-
-        logs = (
-            supabase.table("exercise_logs")
-            .select("exercise_name,reps,weight")
-            .eq("session_id", session_id)
-            .execute()
-            .data
-        )
-
-        best_by_exercise: dict[str, float] = {}
-        for log in logs or []:
-            reps = int(log.get("reps") or 0)
-            weight = float(log.get("weight") or 0)
-            estimate = _estimate_one_rep_max(weight, reps)
-            if estimate <= 0:
-                continue
-            name = log.get("exercise_name") or "Unknown"
-            best_by_exercise[name] = max(best_by_exercise.get(name, 0), estimate)
-
-        pr_updates = []
-        for exercise_name, value in best_by_exercise.items():
-            existing = (
-                supabase.table("prs")
-                .select("id,value")
-                .eq("user_id", session["user_id"])
-                .eq("exercise_name", exercise_name)
-                .eq("metric", "estimated_1rm")
-                .order("value", desc=True)
-                .limit(1)
-                .execute()
-                .data
-            )
-            previous_value = None
-            if existing:
-                previous_value = float(existing[0]["value"])
-                if value <= previous_value:
-                    continue
-
-            supabase.table("prs").insert(
-                {
-                    "user_id": session["user_id"],
-                    "exercise_name": exercise_name,
-                    "metric": "estimated_1rm",
-                    "value": value,
-                }
-            ).execute()
-
-            pr_updates.append(
-                {
-                    "exercise_name": exercise_name,
-                    "value": value,
-                    "previous_value": previous_value,
-                }
-            )
+            for row in new_prs or []
+        ]
 
+        owner_id = session["user_id"]
+        exercise_history_cache.pop_where(lambda key: key[0] == owner_id)
         return {
             "session_id": session_id,
             "status": payload.status,
@@ -651,39 +700,37 @@ async def complete_session(session_id: str, payload: CompleteSessionRequest):
 async def session_logs(session_id: str):
     supabase: Client = get_supabase()
     try:
+        columns = "id,exercise_name,sets,reps,weight,duration_minutes,notes,created_at"
+        if ("exercise_logs", "duration_minutes") in _missing_columns:
+            columns = "id,exercise_name,sets,reps,weight,notes,created_at"
         try:
-            logs = (
+            logs = await run_query(
                 supabase.table("exercise_logs")
-                .select("id,exercise_name,sets,reps,weight,duration_minutes,notes,created_at")
+                .select(columns)
                 .eq("session_id", session_id)
                 .order("created_at")
-                .execute()
-                .data
             )
         except Exception as exc:
             if not _is_missing_column_error(exc, "duration_minutes"):
                 raise
-            logs = (
+            _missing_columns.add(("exercise_logs", "duration_minutes"))
+            logs = await run_query(
                 supabase.table("exercise_logs")
                 .select("id,exercise_name,sets,reps,weight,notes,created_at")
                 .eq("session_id", session_id)
                 .order("created_at")
-                .execute()
-                .data
             )
         logs = logs or []
         log_ids = [log.get("id") for log in logs if log.get("id")]
-        if log_ids:
+        if log_ids and "exercise_sets" not in _missing_tables:
             try:
-                set_rows = (
+                set_rows = await run_query(
                     supabase.table("exercise_sets")
                     .select(
                         "exercise_log_id,set_index,reps,weight,is_warmup,duration_seconds"
                     )
                     .in_("exercise_log_id", log_ids)
                     .order("set_index")
-                    .execute()
-                    .data
                 )
                 set_map: dict[str, list[dict]] = {}
                 for row in set_rows or []:
@@ -704,7 +751,8 @@ async def session_logs(session_id: str):
             except Exception as exc:
                 if not _is_missing_table_error(exc, "exercise_sets"):
                     raise
-        return {"session_id": session_id, "logs": logs}
+                _missing_tables.add("exercise_sets")
+        return ORJSONResponse({"session_id": session_id, "logs": logs})
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
 
@@ -713,34 +761,23 @@ async def session_logs(session_id: str):
 async def exercise_history(user_id: str, exercise_name: str, limit: int = 20):
     supabase: Client = get_supabase()
     normalized_user_id = _normalize_user_id(user_id)
+    cache_key = (normalized_user_id, exercise_name, limit)
+    cached = exercise_history_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
     try:
-        sessions = (
-            supabase.table("workout_sessions")
-            .select("id,created_at")
-            .eq("user_id", normalized_user_id)
-            .execute()
-            .data
-        )
-        if not sessions:
-            return {
-                "exercise_name": exercise_name,
-                "entries": [],
-                "best_set": None,
-                "estimated_1rm": 0,
-                "trend": [],
-            }
-
-        session_map = {row["id"]: row.get("created_at") for row in sessions}
-        session_ids = list(session_map.keys())
-        logs = (
+        # The session's created_at is embedded and the inner join scopes the
+        # logs to this user, so the user's sessions are never listed.
+        logs = await run_query(
             supabase.table("exercise_logs")
-            .select("id,session_id,exercise_name,sets,reps,weight,notes,created_at")
+            .select(
+                "id,session_id,exercise_name,sets,reps,weight,notes,created_at,"
+                "workout_sessions!inner(user_id,created_at)"
+            )
             .eq("exercise_name", exercise_name)
-            .in_("session_id", session_ids)
+            .eq("workout_sessions.user_id", normalized_user_id)
             .order("created_at", desc=True)
             .limit(limit)
-            .execute()
-            .data
         )
 
         entries = []
@@ -753,7 +790,7 @@ async def exercise_history(user_id: str, exercise_name: str, limit: int = 20):
             estimated = _estimate_one_rep_max(weight, reps)
             entry = {
                 "id": log.get("id"),
-                "date": session_map.get(log.get("session_id")),
+                "date": (log.get("workout_sessions") or {}).get("created_at"),
                 "sets": log.get("sets") or 0,
                 "reps": reps,
                 "weight": weight,
@@ -769,12 +806,14 @@ async def exercise_history(user_id: str, exercise_name: str, limit: int = 20):
                     "estimated_1rm": estimated,
                 }
 
-        return {
+        response = {
             "exercise_name": exercise_name,
             "entries": entries,
             "best_set": best_set,
             "estimated_1rm": best_estimated,
             "trend": trend,
         }
+        exercise_history_cache.set(cache_key, response)
+        return ORJSONResponse(response)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
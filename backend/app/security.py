@@ -0,0 +1,33 @@
+import hashlib
+import hmac
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+
+
+def hash_password(password: str) -> str:
+    # argon2id, ~50 ms per call: run it off the event loop in async handlers.
+    return _hasher.hash(password)
+
+
+def _is_legacy_hash(hashed: str) -> bool:
+    # Rows written before argon2 hold an unsalted sha256 hex digest.
+    return not hashed.startswith("$argon2")
+
+
+def verify_password(password: str, hashed: str | None) -> bool:
+    if not hashed:
+        return False
+    if _is_legacy_hash(hashed):
+        legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return hmac.compare_digest(legacy, hashed)
+    try:
+        return _hasher.verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def needs_rehash(hashed: str) -> bool:
+    return _is_legacy_hash(hashed) or _hasher.check_needs_rehash(hashed)
@@ -1,10 +1,58 @@
+import asyncio
+import dataclasses
 import os
+from functools import lru_cache
 
-from supabase import create_client
+import httpx
+from fastapi import UploadFile
+from supabase import ClientOptions, create_client
 
+# Starlette keeps multipart files up to this size in memory and spools larger
+# ones to a temporary file on disk.
+_SPOOL_MAX_SIZE = 1024 * 1024
+
+@lru_cache(maxsize=1)
 def get_supabase():
     supabase_url = os.environ.get("SUPABASE_URL")
     supabase_key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
     if not supabase_url or not supabase_key:
         raise RuntimeError("SUPABASE_URL/SERVICE_ROLE_KEY must be set")
+    # One HTTP/2 connection pool for PostgREST, storage and auth, sized for the
+    # 64-thread blocking executor so idle connections are kept instead of
+    # reopened. Releases without the httpx_client option keep their defaults.
+    if "httpx_client" in {field.name for field in dataclasses.fields(ClientOptions)}:
+        http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=100, max_keepalive_connections=64, keepalive_expiry=300.0
+            ),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            follow_redirects=True,
+        )
+        return create_client(
+            supabase_url, supabase_key, options=ClientOptions(httpx_client=http_client)
+        )
     return create_client(supabase_url, supabase_key)
+
+async def run_query(query):
+    # supabase-py is synchronous; execute the built query in a worker thread so
+    # async handlers keep the event loop free while PostgREST responds.
+    response = await asyncio.to_thread(query.execute)
+    return response.data
+
+
+async def upload_to_storage(bucket: str, path: str, upload: UploadFile) -> None:
+    # Spooled-to-disk uploads are streamed from their file descriptor so the
+    # image is never copied into a single bytes object; small in-memory ones
+    # are passed as bytes. storage3 only accepts bytes or a BufferedReader.
+    def _upload():
+        storage = get_supabase().storage.from_(bucket)
+        file_options = {"content-type": upload.content_type or "image/jpeg"}
+        upload.file.seek(0)
+        if upload.size is not None and upload.size <= _SPOOL_MAX_SIZE:
+            storage.upload(path, upload.file.read(), file_options=file_options)
+            return
+        with open(upload.file.fileno(), "rb", closefd=False) as stream:
+            storage.upload(path, stream, file_options=file_options)
+
+    await asyncio.to_thread(_upload)
@@ -0,0 +1,47 @@
+from app.routers.workouts import GenerateWorkoutRequest, _generation_key, _normalize_term
+
+
+def _key(**fields):
+    return _generation_key(GenerateWorkoutRequest(**fields))
+
+
+def test_normalize_term_folds_case_and_separators():
+    assert _normalize_term("Pull-up bar") == "pull up bar"
+    assert _normalize_term("pull_up  bar") == "pull up bar"
+    assert _normalize_term("  PULL UP BAR ") == "pull up bar"
+
+
+def test_normalize_term_keeps_plurals():
+    assert _normalize_term("Dumbbells") == "dumbbells"
+    assert _normalize_term("dumbbell") == "dumbbell"
+
+
+def test_generation_key_ignores_case_order_and_separators():
+    assert _key(
+        muscle_groups=["Chest", "triceps"],
+        equipment=["Dumbbells", "pull-up bar"],
+        workout_type="Push",
+        duration_minutes=45,
+    ) == _key(
+        muscle_groups=["triceps", "chest "],
+        equipment=["pull_up bar", "dumbbells"],
+        workout_type="push",
+        duration_minutes=45,
+    )
+
+
+def test_generation_key_keeps_exact_duration():
+    assert _key(muscle_groups=["chest"], duration_minutes=38) != _key(
+        muscle_groups=["chest"], duration_minutes=42
+    )
+    assert _key(muscle_groups=["chest"], duration_minutes=44) != _key(
+        muscle_groups=["chest"], duration_minutes=45
+    )
+
+
+def test_generation_key_distinguishes_different_inputs():
+    assert _key(muscle_groups=["chest"]) != _key(muscle_groups=["back"])
+    assert _key(muscle_groups=["chest"], equipment=["barbell"]) != _key(
+        muscle_groups=["chest"], equipment=["dumbbells"]
+    )
+    assert _key(muscle_groups=["chest"], equipment=[]) == _key(muscle_groups=["chest"])
@@ -379,6 +379,21 @@ type NormalizedCoachExercise = {
   equipment: string[];
 };
 
+async function insertExercisesIgnoringDuplicates(rows: Record<string, unknown>[]) {
+  // exercises.name is unique: names that already exist, or that another request
+  // inserts concurrently, are skipped and then read back with the new rows.
+  const { error } = await supabase
+    .from("exercises")
+    .upsert(rows, { onConflict: "name", ignoreDuplicates: true });
+  if (error) throw new HttpError(500, error.message);
+  const { data, error: selectError } = await supabase
+    .from("exercises")
+    .select("*")
+    .in("name", rows.map((row) => row.name));
+  if (selectError) throw new HttpError(500, selectError.message);
+  return (data ?? []) as Record<string, unknown>[];
+}
+
 async function createCoachWorkout(
   userId: string,
   focus: string,
@@ -470,13 +485,9 @@ async function createCoachWorkout(
           equipment: source?.equipment ?? [],
         };
       });
-      const { data: createdExercises, error: createExerciseError } = await supabase
-        .from("exercises")
-        .insert(missingPayload)
-        .select("id,name");
-      if (createExerciseError) throw new HttpError(500, createExerciseError.message);
+      const createdExercises = await insertExercisesIgnoringDuplicates(missingPayload);
 
-      for (const row of createdExercises ?? []) {
+      for (const row of createdExercises) {
         const record = row as Record<string, unknown>;
         const id = String(record.id ?? "");
         const name = String(record.name ?? "");
@@ -3139,9 +3150,8 @@ serve(async (req) => {
     if (segments[0] === "exercises") {
       if (method === "POST" && segments.length === 1) {
         const payload = await parseJson<Record<string, unknown>>(req);
-        const { data, error } = await supabase.from("exercises").insert(payload).select();
-        if (error) throw new HttpError(500, error.message);
-        return jsonResponse({ exercise: data?.[0] ?? payload });
+        const [exercise] = await insertExercisesIgnoringDuplicates([payload]);
+        return jsonResponse({ exercise: exercise ?? payload });
       }
 
       if (method === "GET" && segments[1] === "search") {
@@ -3220,15 +3230,14 @@ serve(async (req) => {
             .limit(1);
           let exerciseId = existing?.[0]?.id;
           if (!exerciseId) {
-            const { data: created } = await supabase
-              .from("exercises")
-              .insert({
+            const created = await insertExercisesIgnoringDuplicates([
+              {
                 name: exercise.name,
                 muscle_groups: exercise.muscle_groups ?? [],
                 equipment: exercise.equipment ?? [],
-              })
-              .select();
-            if (!created || created.length === 0) throw new HttpError(500, "Failed to create exercise");
+              },
+            ]);
+            if (created.length === 0) throw new HttpError(500, "Failed to create exercise");
             exerciseId = created[0].id;
           }
 
@@ -3329,15 +3338,14 @@ serve(async (req) => {
             .limit(1);
           let exerciseId = existing?.[0]?.id;
           if (!exerciseId) {
-            const { data: created } = await supabase
-              .from("exercises")
-              .insert({
+            const created = await insertExercisesIgnoringDuplicates([
+              {
                 name: exercise.name,
                 muscle_groups: exercise.muscle_groups ?? [],
                 equipment: exercise.equipment ?? [],
-              })
-              .select();
-            if (!created || created.length === 0) throw new HttpError(500, "Failed to create exercise");
+              },
+            ]);
+            if (created.length === 0) throw new HttpError(500, "Failed to create exercise");
             exerciseId = created[0].id;
           }
           await supabase.from("workout_template_exercises").insert({
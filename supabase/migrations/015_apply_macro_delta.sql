@@ -0,0 +1,25 @@
+-- supabase/migrations/015_apply_macro_delta.sql
+
+-- Applies a weekly check-in macro delta in a single statement so concurrent
+-- check-ins cannot overwrite each other. Returns the new macros, or null when
+-- the profile has no complete numeric macro targets to adjust.
+create or replace function apply_macro_delta(uid uuid, delta jsonb)
+returns jsonb
+language sql
+as $$
+  update profiles
+  set
+    macros = jsonb_build_object(
+      'calories', greatest(1200, round((macros->>'calories')::numeric)::int + coalesce((delta->>'calories')::int, 0)),
+      'protein', greatest(0, round((macros->>'protein')::numeric)::int + coalesce((delta->>'protein')::int, 0)),
+      'carbs', greatest(0, round((macros->>'carbs')::numeric)::int + coalesce((delta->>'carbs')::int, 0)),
+      'fats', greatest(0, round((macros->>'fats')::numeric)::int + coalesce((delta->>'fats')::int, 0))
+    ),
+    updated_at = now()
+  where user_id = uid
+    and (macros->>'calories') ~ '^\s*-?\d+(\.\d+)?\s*$'
+    and (macros->>'protein') ~ '^\s*-?\d+(\.\d+)?\s*$'
+    and (macros->>'carbs') ~ '^\s*-?\d+(\.\d+)?\s*$'
+    and (macros->>'fats') ~ '^\s*-?\d+(\.\d+)?\s*$'
+  returning macros;
+$$;
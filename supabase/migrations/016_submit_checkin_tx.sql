@@ -0,0 +1,43 @@
+-- supabase/migrations/016_submit_checkin_tx.sql
+
+-- Stores a weekly check-in and applies its suggested macro delta in one
+-- transaction. macro_update carries {suggested, delta} from the API; the
+-- applied flag and resulting macros are filled in here and saved with the row.
+create or replace function submit_checkin_tx(
+  uid uuid,
+  checkin_date date,
+  weight numeric,
+  adherence jsonb,
+  photos jsonb,
+  ai_summary jsonb,
+  macro_update jsonb,
+  cardio_update jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  new_macros jsonb;
+  inserted weekly_checkins;
+begin
+  if coalesce((macro_update->>'suggested')::boolean, false) then
+    new_macros := apply_macro_delta(uid, coalesce(macro_update->'delta', '{}'::jsonb));
+  end if;
+
+  insert into weekly_checkins (user_id, date, weight, adherence, photos, ai_summary, macro_update, cardio_update)
+  values (
+    uid,
+    coalesce(checkin_date, current_date),
+    weight,
+    coalesce(adherence, '{}'::jsonb),
+    coalesce(photos, '[]'::jsonb),
+    coalesce(ai_summary, '{}'::jsonb),
+    coalesce(macro_update, '{}'::jsonb)
+      || jsonb_build_object('applied', new_macros is not null, 'new_macros', new_macros),
+    coalesce(cardio_update, '{}'::jsonb)
+  )
+  returning * into inserted;
+
+  return to_jsonb(inserted);
+end;
+$$;
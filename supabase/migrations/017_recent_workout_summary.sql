@@ -0,0 +1,50 @@
+-- supabase/migrations/017_recent_workout_summary.sql
+
+-- Compact recent-training summary for the coach chat context: the latest
+-- sessions with only their heaviest logged sets, instead of raw log rows.
+create or replace function recent_workout_summary(
+  uid uuid,
+  session_limit int default 3,
+  top_set_limit int default 3
+)
+returns jsonb
+language sql
+stable
+as $$
+  select coalesce(jsonb_agg(recent.summary order by recent.created_at desc), '[]'::jsonb)
+  from (
+    select
+      s.created_at,
+      jsonb_build_object(
+        'status', s.status,
+        'duration_seconds', s.duration_seconds,
+        'created_at', s.created_at,
+        'completed_at', s.completed_at,
+        'top_sets', coalesce(
+          (
+            select jsonb_agg(
+              jsonb_build_object(
+                'exercise_name', l.exercise_name,
+                'sets', l.sets,
+                'reps', l.reps,
+                'weight', l.weight
+              )
+              order by l.weight desc nulls last, l.created_at desc
+            )
+            from (
+              select exercise_name, sets, reps, weight, created_at
+              from exercise_logs
+              where session_id = s.id
+              order by weight desc nulls last, created_at desc
+              limit top_set_limit
+            ) l
+          ),
+          '[]'::jsonb
+        )
+      ) as summary
+    from workout_sessions s
+    where s.user_id = uid
+    order by s.created_at desc
+    limit session_limit
+  ) recent;
+$$;
@@ -0,0 +1,12 @@
+-- supabase/migrations/018_touch_chat_thread.sql
+
+-- Bumps thread activity timestamps with the database clock so the API does
+-- not have to format and send its own.
+create or replace function touch_chat_thread(thread_id uuid)
+returns void
+language sql
+as $$
+  update chat_threads
+  set updated_at = now(), last_message_at = now()
+  where id = thread_id;
+$$;
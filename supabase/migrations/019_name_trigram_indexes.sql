@@ -0,0 +1,9 @@
+-- supabase/migrations/019_name_trigram_indexes.sql
+
+-- Exercise and food search filter with `name ilike '%query%'`, which the plain
+-- btree indexes from 002 cannot serve. Trigram GIN indexes let Postgres answer
+-- those substring matches without scanning the whole table.
+create extension if not exists pg_trgm;
+
+create index if not exists idx_exercises_name_trgm on exercises using gin (name gin_trgm_ops);
+create index if not exists idx_food_items_name_trgm on food_items using gin (name gin_trgm_ops);
@@ -0,0 +1,68 @@
+-- supabase/migrations/020_submit_onboarding.sql
+
+-- Completes onboarding in one round trip and one transaction: resolves the
+-- user (by id, then by email, else creates it), saves the final onboarding
+-- state and upserts the profile. Returns the resolved user id.
+-- profile carries the profiles columns to write; macros is only overwritten
+-- when the key is present.
+create or replace function submit_onboarding(
+  requested_id uuid,
+  user_email text,
+  hashed_password text,
+  state_data jsonb,
+  profile jsonb
+)
+returns uuid
+language plpgsql
+as $$
+declare
+  resolved uuid;
+begin
+  if requested_id is not null then
+    select id into resolved from users where id = requested_id;
+  end if;
+  if resolved is null and coalesce(user_email, '') <> '' then
+    select id into resolved from users where email = user_email;
+  end if;
+  if resolved is null then
+    if coalesce(user_email, '') = '' then
+      -- PT400 is surfaced by PostgREST as an HTTP 400.
+      raise exception 'Email is required.' using errcode = 'PT400';
+    end if;
+    insert into users (id, email, hashed_password, role)
+    values (coalesce(requested_id, gen_random_uuid()), user_email, hashed_password, 'user')
+    on conflict (email) do update set email = excluded.email
+    returning id into resolved;
+  end if;
+
+  update onboarding_states
+  set step_index = 5, data = state_data, is_complete = true
+  where user_id = resolved;
+  if not found then
+    insert into onboarding_states (user_id, step_index, data, is_complete)
+    values (resolved, 5, state_data, true);
+  end if;
+
+  insert into profiles (user_id, full_name, age, height_cm, weight_kg, goal, preferences, macros)
+  values (
+    resolved,
+    profile->>'full_name',
+    (profile->>'age')::int,
+    (profile->>'height_cm')::numeric,
+    (profile->>'weight_kg')::numeric,
+    profile->>'goal',
+    coalesce(profile->'preferences', '{}'::jsonb),
+    coalesce(profile->'macros', '{}'::jsonb)
+  )
+  on conflict (user_id) do update set
+    full_name = excluded.full_name,
+    age = excluded.age,
+    height_cm = excluded.height_cm,
+    weight_kg = excluded.weight_kg,
+    goal = excluded.goal,
+    preferences = excluded.preferences,
+    macros = case when profile ? 'macros' then excluded.macros else profiles.macros end;
+
+  return resolved;
+end;
+$$;
@@ -0,0 +1,22 @@
+-- supabase/migrations/021_macro_adherence.sql
+
+-- Per-day macro totals for the adherence chart, summed in the database so the
+-- API receives one row per day instead of every nutrition log. Non-numeric
+-- totals values count as zero.
+create or replace function macro_adherence(uid uuid, start_date date, end_date date)
+returns table (day date, calories numeric, protein numeric, carbs numeric, fats numeric)
+language sql
+stable
+as $$
+  select
+    l.date as day,
+    coalesce(sum(case when l.totals->>'calories' ~ '^\s*-?\d+(\.\d+)?\s*$' then (l.totals->>'calories')::numeric end), 0),
+    coalesce(sum(case when l.totals->>'protein' ~ '^\s*-?\d+(\.\d+)?\s*$' then (l.totals->>'protein')::numeric end), 0),
+    coalesce(sum(case when l.totals->>'carbs' ~ '^\s*-?\d+(\.\d+)?\s*$' then (l.totals->>'carbs')::numeric end), 0),
+    coalesce(sum(case when l.totals->>'fats' ~ '^\s*-?\d+(\.\d+)?\s*$' then (l.totals->>'fats')::numeric end), 0)
+  from nutrition_logs l
+  where l.user_id = uid
+    and l.date between start_date and end_date
+  group by l.date
+  order by l.date;
+$$;
@@ -0,0 +1,7 @@
+-- supabase/migrations/022_progress_photo_indexes.sql
+
+-- The progress photo list filters by `tags @> '{category:...}'` and pages
+-- newest first per user. A GIN index serves the array containment filter and
+-- the composite index returns a user's photos already in created_at order.
+create index if not exists idx_progress_photos_tags on progress_photos using gin (tags);
+create index if not exists idx_progress_photos_user_created on progress_photos (user_id, created_at desc);
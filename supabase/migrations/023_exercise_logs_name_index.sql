@@ -0,0 +1,5 @@
+-- supabase/migrations/023_exercise_logs_name_index.sql
+
+-- Exercise history reads one exercise's most recent logs, joined to the
+-- user's sessions. This index returns them already in created_at order.
+create index if not exists idx_exercise_logs_name_created_at on exercise_logs (exercise_name, created_at desc);
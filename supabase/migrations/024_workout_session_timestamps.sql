@@ -0,0 +1,25 @@
+-- supabase/migrations/024_workout_session_timestamps.sql
+
+-- Session start and completion times come from the database clock instead of
+-- the API: started_at defaults to now() on insert, and completed_at is stamped
+-- when a session leaves the in_progress status.
+alter table workout_sessions
+  alter column started_at set default now();
+
+create or replace function stamp_workout_session_completed_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.status is distinct from 'in_progress' and old.status = 'in_progress' then
+    new.completed_at := now();
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists workout_sessions_completed_at on workout_sessions;
+create trigger workout_sessions_completed_at
+  before update of status on workout_sessions
+  for each row
+  execute function stamp_workout_session_completed_at();
@@ -0,0 +1,41 @@
+-- supabase/migrations/025_record_session_prs.sql
+
+-- Records estimated one-rep-max PRs for a completed session in one statement:
+-- the best Epley estimate per exercise in the session is compared with the
+-- user's stored best and inserted only when it beats it. Returns the new PRs
+-- with the value they replaced (null for a first record).
+create or replace function record_session_prs(target_session uuid)
+returns table (exercise_name text, value numeric, previous_value numeric)
+language sql
+as $$
+  with session_owner as (
+    select s.user_id from workout_sessions s where s.id = target_session
+  ),
+  bests as (
+    select l.exercise_name, max(round(l.weight * (1 + l.reps / 30.0), 2)) as best
+    from exercise_logs l
+    where l.session_id = target_session
+      and l.weight > 0
+      and l.reps > 0
+    group by l.exercise_name
+  ),
+  previous as (
+    select p.exercise_name, max(p.value) as best
+    from prs p
+    where p.user_id = (select user_id from session_owner)
+      and p.metric = 'estimated_1rm'
+      and p.exercise_name in (select b.exercise_name from bests b)
+    group by p.exercise_name
+  ),
+  inserted as (
+    insert into prs (user_id, exercise_name, metric, value)
+    select (select user_id from session_owner), b.exercise_name, 'estimated_1rm', b.best
+    from bests b
+    left join previous pv on pv.exercise_name = b.exercise_name
+    where pv.best is null or b.best > pv.best
+    returning prs.exercise_name, prs.value
+  )
+  select i.exercise_name, i.value, pv.best
+  from inserted i
+  left join previous pv on pv.exercise_name = i.exercise_name;
+$$;
@@ -0,0 +1,28 @@
+-- supabase/migrations/026_unique_exercise_names.sql
+
+-- Exercise names identify catalog rows. Point template links at the oldest row
+-- for each name, drop the duplicates, then enforce uniqueness so concurrent
+-- get-or-create calls cannot insert the same name twice.
+create temporary table exercise_name_keepers as
+select
+  id,
+  first_value(id) over (partition by name order by created_at nulls last, id) as keep_id
+from exercises;
+
+update workout_template_exercises wte
+set exercise_id = k.keep_id
+from exercise_name_keepers k
+where wte.exercise_id = k.id
+  and k.id <> k.keep_id;
+
+delete from exercises e
+using exercise_name_keepers k
+where e.id = k.id
+  and k.id <> k.keep_id;
+
+drop table exercise_name_keepers;
+
+create unique index if not exists exercises_name_key on exercises (name);
+
+-- The unique index serves every lookup the plain name index did.
+drop index if exists idx_exercises_name;
@@ -0,0 +1,47 @@
+-- supabase/migrations/027_create_workout_template.sql
+
+-- Saves a workout template with its exercises in one transaction: the
+-- template row, any exercise names missing from the catalog, and the ordered
+-- link rows. template_exercises is the API's exercise list as a jsonb array.
+-- Relies on the unique exercises.name index from 026.
+create or replace function create_workout_template(
+  uid uuid,
+  template_title text,
+  template_description text,
+  template_mode text,
+  template_exercises jsonb
+)
+returns uuid
+language plpgsql
+as $$
+declare
+  new_template_id uuid;
+begin
+  insert into workout_templates (user_id, title, description, mode)
+  values (uid, template_title, template_description, coalesce(template_mode, 'manual'))
+  returning id into new_template_id;
+
+  insert into exercises (name, muscle_groups, equipment)
+  select distinct on (item.value->>'name')
+    item.value->>'name',
+    array(select jsonb_array_elements_text(coalesce(item.value->'muscle_groups', '[]'::jsonb))),
+    array(select jsonb_array_elements_text(coalesce(item.value->'equipment', '[]'::jsonb)))
+  from jsonb_array_elements(coalesce(template_exercises, '[]'::jsonb)) with ordinality as item(value, idx)
+  order by item.value->>'name', item.idx
+  on conflict (name) do nothing;
+
+  insert into workout_template_exercises (template_id, exercise_id, position, sets, reps, rest_seconds, notes)
+  select
+    new_template_id,
+    e.id,
+    item.idx - 1,
+    coalesce((item.value->>'sets')::int, 0),
+    coalesce((item.value->>'reps')::int, 0),
+    coalesce((item.value->>'rest_seconds')::int, 0),
+    item.value->>'notes'
+  from jsonb_array_elements(coalesce(template_exercises, '[]'::jsonb)) with ordinality as item(value, idx)
+  join exercises e on e.name = item.value->>'name';
+
+  return new_template_id;
+end;
+$$;
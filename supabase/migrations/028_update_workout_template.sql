@@ -0,0 +1,94 @@
+-- supabase/migrations/028_update_workout_template.sql
+
+-- Template edits go through a function as well, so the update, the link
+-- delete and the re-insert run in one transaction. The exercise handling from
+-- create_workout_template moves into set_workout_template_exercises, which
+-- both functions share.
+create or replace function set_workout_template_exercises(
+  target_template uuid,
+  template_exercises jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+  delete from workout_template_exercises where template_id = target_template;
+
+  insert into exercises (name, muscle_groups, equipment)
+  select distinct on (item.value->>'name')
+    item.value->>'name',
+    array(select jsonb_array_elements_text(coalesce(item.value->'muscle_groups', '[]'::jsonb))),
+    array(select jsonb_array_elements_text(coalesce(item.value->'equipment', '[]'::jsonb)))
+  from jsonb_array_elements(coalesce(template_exercises, '[]'::jsonb)) with ordinality as item(value, idx)
+  order by item.value->>'name', item.idx
+  on conflict (name) do nothing;
+
+  insert into workout_template_exercises (template_id, exercise_id, position, sets, reps, rest_seconds, notes)
+  select
+    target_template,
+    e.id,
+    item.idx - 1,
+    coalesce((item.value->>'sets')::int, 0),
+    coalesce((item.value->>'reps')::int, 0),
+    coalesce((item.value->>'rest_seconds')::int, 0),
+    item.value->>'notes'
+  from jsonb_array_elements(coalesce(template_exercises, '[]'::jsonb)) with ordinality as item(value, idx)
+  join exercises e on e.name = item.value->>'name';
+end;
+$$;
+
+create or replace function create_workout_template(
+  uid uuid,
+  template_title text,
+  template_description text,
+  template_mode text,
+  template_exercises jsonb
+)
+returns uuid
+language plpgsql
+as $$
+declare
+  new_template_id uuid;
+begin
+  insert into workout_templates (user_id, title, description, mode)
+  values (uid, template_title, template_description, coalesce(template_mode, 'manual'))
+  returning id into new_template_id;
+
+  perform set_workout_template_exercises(new_template_id, template_exercises);
+
+  return new_template_id;
+end;
+$$;
+
+-- Returns the template owner's id so the API can drop its cached template
+-- list, or no row when the template does not exist.
+create or replace function update_workout_template(
+  target_template uuid,
+  template_title text,
+  template_description text,
+  template_mode text,
+  template_exercises jsonb
+)
+returns table (user_id uuid)
+language plpgsql
+as $$
+declare
+  owner_id uuid;
+begin
+  update workout_templates t
+  set
+    title = template_title,
+    description = template_description,
+    mode = template_mode
+  where t.id = target_template
+  returning t.user_id into owner_id;
+
+  if not found then
+    return;
+  end if;
+
+  perform set_workout_template_exercises(target_template, template_exercises);
+
+  return query select owner_id;
+end;
+$$;